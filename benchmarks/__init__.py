@@ -0,0 +1,4 @@
+'''Benchmarks for the Panawave hot paths. Run from the repository root:
+
+    python -m benchmarks.run --help
+'''
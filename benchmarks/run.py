@@ -0,0 +1,199 @@
+'''Time the Panawave hot paths on a synthetic composition, write the results
+as JSON and optionally compare them against a stored baseline.
+
+    python -m benchmarks.run --rings 200 --stickers 500 -o results.json
+
+To check a change for regressions, record a baseline before making it and
+compare against it afterwards:
+
+    python -m benchmarks.run -o baseline.json
+    python -m benchmarks.run --baseline baseline.json
+'''
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+from time import perf_counter
+
+import pwgeometry
+import pwraster
+from radialstructs import PanawaveStruct
+from benchmarks.synthetic import make_struct
+
+
+def timeit(func, repeat=5, setup=None):
+    '''Run func `repeat` times and return a dict of best/median/mean
+    seconds. setup, if given, is run untimed before each call.'''
+    times = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return {"best": min(times), "median": statistics.median(times),
+            "mean": statistics.mean(times), "runs": repeat}
+
+
+class _CoordsRenderer:
+    def render(self, pw_struct):
+        for ring in pw_struct.ring_array.values():
+            pwgeometry.flat_coords(ring.displayed_vertices())
+
+
+def _tk_canvas():
+    '''An offscreen Tk canvas, or None where no display is available.'''
+    try:
+        import tkinter
+        root = tkinter.Tk()
+    except Exception:
+        return None
+    root.withdraw()
+    canvas = tkinter.Canvas(root, width=600, height=600)
+    return canvas
+
+
+def run_benchmarks(rings, stickers, scaler_length, vertices, repeat=5):
+    pw_struct = make_struct(rings, stickers, scaler_length, vertices)
+    ring_list = list(pw_struct.ring_array.values())
+    results = {}
+
+    def invalidate():
+        for ring in ring_list:
+            ring._initialize_geometry()
+
+    def invalidate_uncached():
+        invalidate()
+        pwgeometry.geometry_cache.clear()
+
+    def compute_geometry():
+        for ring in ring_list:
+            ring.vertices
+    results["geometry"] = timeit(compute_geometry, repeat,
+            setup=invalidate_uncached)
+    results["geometry_cached"] = timeit(compute_geometry, repeat,
+            setup=invalidate)
+
+    # Frames go through the same render_frame as in the editor, to a
+    # renderer which only computes the coordinates the canvas would get.
+    coords_renderer = _CoordsRenderer()
+    pw_struct.attach_renderer(coords_renderer)
+    pw_struct.orbit_clock.seek(17.5)
+    for ring in ring_list:
+        ring.radial_speed = 0.5
+    results["orbit_frame_headless"] = timeit(pw_struct.render_frame, repeat)
+    pw_struct.detach_renderer(coords_renderer)
+
+    results["raster_png"] = timeit(
+            lambda: pwraster.render_struct(pw_struct, 600, supersample=2),
+            repeat)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for ext in (".pwv", ".json"):
+            path = os.path.join(tmp, "bench" + ext)
+            results["write_out" + ext] = timeit(
+                    lambda: pw_struct.write_out(path), repeat)
+            results["load_from_file" + ext] = timeit(
+                    lambda: PanawaveStruct().load_from_file(path), repeat)
+
+    canvas = _tk_canvas()
+    if canvas is not None:
+        def draw_fresh():
+            pw_struct.clear_canvas(canvas)
+            pw_struct.draw(canvas)
+            canvas.update_idletasks()
+        results["tk_draw_create"] = timeit(draw_fresh, repeat)
+
+        def draw_frame():
+            pw_struct.render_frame()
+            canvas.update_idletasks()
+        pw_struct.attach_canvas(canvas)
+        pw_struct.draw(canvas)
+        results["tk_draw_one_frame"] = timeit(draw_frame, repeat)
+        canvas.winfo_toplevel().destroy()
+    else:
+        logging.warning("No display available; skipping Tk drawing "
+                "benchmarks.")
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''Return a list of (name, baseline best, current best, ratio) for each
+    benchmark slower than the baseline by more than `threshold` (e.g. 0.2
+    for 20%).'''
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]["best"]
+        ratio = result["best"] / base if base else float("inf")
+        if ratio > 1 + threshold:
+            regressions.append((name, base, result["best"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rings", type=int, default=100)
+    parser.add_argument("--stickers", type=int, default=200,
+            help="stickers per ring")
+    parser.add_argument("--scaler-length", type=int, default=3,
+            help="length of each ring's scaler_list")
+    parser.add_argument("--vertices", type=int, default=4,
+            help="vertices per sticker")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-numpy", action="store_true",
+            help="force the pure-python geometry path")
+    parser.add_argument("-o", "--output",
+            help="write results as JSON to this file")
+    parser.add_argument("--baseline",
+            help="compare against results previously written with -o")
+    parser.add_argument("--threshold", type=float, default=0.2,
+            help="fractional slowdown counted as a regression (default 0.2)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.no_numpy:
+        pwgeometry.use_numpy = False
+    params = {"rings": args.rings, "stickers": args.stickers,
+            "scaler_length": args.scaler_length, "vertices": args.vertices}
+    results = run_benchmarks(repeat=args.repeat, **params)
+    report = {
+        "params": params,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": pwgeometry.use_numpy and pwgeometry.numpy.__version__,
+            },
+        "results": results,
+        }
+    for name, result in sorted(results.items()):
+        print("{0:<28}{1:>10.2f}ms best {2:>10.2f}ms median".format(
+            name, result["best"] * 1000, result["median"] * 1000))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get("params") != params:
+            print("Warning: baseline was recorded with different parameters: "
+                    "{0}".format(baseline.get("params")), file=sys.stderr)
+        regressions = compare(results, baseline["results"], args.threshold)
+        for name, base, current, ratio in regressions:
+            print("REGRESSION {0}: {1:.2f}ms -> {2:.2f}ms ({3:+.0%})".format(
+                name, base * 1000, current * 1000, ratio - 1))
+        if regressions:
+            return 1
+        print("No regressions beyond {0:.0%} of the baseline.".format(
+            args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+'''Time how long the editor's entry points take to import, each in a fresh
+interpreter, and fail if any exceeds its budget or the headless core
+imports a GUI or debugging module.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --budget-scale 2   # on a slow machine
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# module -> import budget in milliseconds. The headless core must stay
+# usable without Tk or IPython installed.
+BUDGETS = {
+    "radialstructs": 300,
+    "pwbatch": 350,
+    "pwinterface": 500,
+    }
+
+# Modules the headless core must not import.
+FORBIDDEN = ("tkinter", "_tkinter", "IPython")
+HEADLESS = ("radialstructs", "pwbatch")
+
+_PROBE = '''
+import json, sys
+from time import perf_counter
+start = perf_counter()
+import {module}
+elapsed = perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+'''
+
+
+def time_import(module, repeat=5):
+    '''Best of `repeat` import times of module in a fresh interpreter, in
+    seconds, and the modules loaded by the last run.'''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for i in range(repeat):
+        output = subprocess.run([sys.executable, "-c",
+                _PROBE.format(module=module)], cwd=root, check=True,
+                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        times.append(result["seconds"])
+    return min(times), result["modules"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-scale", type=float, default=1.0,
+            help="multiply every budget by this factor")
+    args = parser.parse_args(argv)
+
+    failures = []
+    for module, budget in BUDGETS.items():
+        budget = budget * args.budget_scale
+        try:
+            seconds, modules = time_import(module, args.repeat)
+        except subprocess.CalledProcessError:
+            # e.g. pwinterface where Tk is not installed
+            print("{0:<16}   could not be imported; skipped".format(module))
+            continue
+        over = seconds * 1000 > budget
+        print("{0:<16}{1:>10.1f}ms  budget {2:.0f}ms{3}".format(module,
+            seconds * 1000, budget, "  OVER BUDGET" if over else ""))
+        if over:
+            failures.append(module)
+        if module in HEADLESS:
+            loaded = [name for name in FORBIDDEN if name in modules]
+            if loaded:
+                print("{0} imports {1}".format(module, ", ".join(loaded)))
+                failures.append(module)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
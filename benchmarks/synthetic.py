@@ -0,0 +1,31 @@
+from math import cos, sin, pi
+from random import Random
+
+from radialstructs import PanawaveStruct, StickerRing
+
+
+def regular_polygon(vertices, size=20):
+    '''A base sticker with the given number of vertices, roughly the size of
+    the default 20x20 square.'''
+    return [[size / 2 * cos(2 * pi * i / vertices),
+             size / 2 * sin(2 * pi * i / vertices)] for i in range(vertices)]
+
+
+def make_struct(rings=50, stickers=100, scaler_length=1, vertices=4, seed=0):
+    '''Build a synthetic composition of `rings` rings with `stickers`
+    stickers each. Every ring gets a scaler_list of `scaler_length` values
+    and a base sticker with `vertices` vertices. The same seed always gives
+    the same composition.'''
+    rng = Random(seed)
+    pw_struct = PanawaveStruct()
+    geometry = None
+    if vertices != len(StickerRing.baseStickerPoly):
+        geometry = regular_polygon(vertices)
+    for i in range(rings):
+        scaler_list = [rng.randint(1, 3) for s in range(scaler_length)]
+        kwargs = {}
+        if geometry is not None:
+            kwargs["geometry"] = geometry
+        pw_struct.add_ring(20 + i * 280 / max(1, rings), stickers,
+                rng.uniform(0, 360), scaler_list, **kwargs)
+    return pw_struct
@@ -1,43 +1,79 @@
-from tkinter import Tk
-from time import sleep
-import os
+import argparse
 import sys
-# Debugging console
-from IPython import embed
 
-from pwinterface import PanawaveApp
 import pwlogging
+import pwprofile
 import logging as log
 
 
-def pw_json_serializer(object):
-    '''generic method for representing objects in json. will use an
-    object's _as_json method if found.'''
-    try :
-        return object._as_json()
-    except (NameError, AttributeError):
-        return object.__dict__
-
-def tracefunc(frame, event, arg, indent=[0]):
-    '''Debugging function which can be attached to all function calls.
-    http://stackoverflow.com/a/8315566
-    '''
-    if event == "call":
-        indent[0] += 2
-        print("-" * indent[0] + "> call function", frame.f_code.co_name)
-    elif event == "return":
-        print("<" + "-" * indent[0], "exit function", frame.f_code.co_name)
-        indent[0] -= 2
-    return tracefunc
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Panawave Umbrella Editor. With --render, renders "
+            "the given files without starting the GUI.")
+    parser.add_argument("files", nargs="*",
+            help="composition(s) to open; with --render, files or glob "
+            "patterns to render")
+    parser.add_argument("--render", choices=["png", "svg", "ps"],
+            help="render the files headlessly to this format and exit")
+    parser.add_argument("-o", "--output-dir",
+            help="directory for rendered files (default: beside each input)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+            help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--size", type=int, default=600,
+            help="rendered image size in pixels (points for ps)")
+    parser.add_argument("--supersample", type=int, default=1,
+            help="anti-aliasing factor for png rendering")
+    parser.add_argument("--log-level", choices=pwlogging.LEVELS,
+            default="info",
+            help="logging level (default: info); trace also logs per-frame "
+            "and per-event detail")
+    parser.add_argument("--profile", choices=pwprofile.MODES,
+            help="profile the session (or a --render batch, rendered in "
+            "this process unless -j is given) with cProfile or a sampling "
+            "profiler; subsystem timings are recorded either way")
+    parser.add_argument("--profile-output", default="panawave-profile.json",
+            help="Chrome trace file written when profiling ends, for "
+            "chrome://tracing, Perfetto or speedscope (default: "
+            "panawave-profile.json)")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.render:
+        pwlogging.create_logger(level=args.log_level)
+        import pwbatch
+        jobs = args.jobs
+        if args.profile:
+            # worker processes would not be profiled, so unless asked
+            # otherwise render in this one
+            jobs = jobs or 1
+            session = pwprofile.ProfileSession(args.profile).start()
+        try:
+            failures = pwbatch.render_batch(args.files, format=args.render,
+                    output_dir=args.output_dir, jobs=jobs, size=args.size,
+                    supersample=args.supersample)
+        finally:
+            if args.profile:
+                session.stop()
+                session.report()
+                session.export(args.profile_output)
+        sys.exit(1 if failures else 0)
     # configure logging
-    pwlogging.create_logger(level=log.DEBUG)
+    # queued, so that logging never blocks the Tk event loop on output
+    pwlogging.create_logger(level=args.log_level, queued=True)
     log.info("initializing Panawave Umbrella Editor...")
-    profile = False
-    if profile == True:
-        sys.setprofile(tracefunc)
+    if args.profile:
+        session = pwprofile.ProfileSession(args.profile).start()
+    from tkinter import Tk
+    from pwinterface import PanawaveApp
     master = Tk()
     # global our_app
-    our_app = PanawaveApp(master)
+    try:
+        our_app = PanawaveApp(master,
+                file=args.files[0] if args.files else None)
+    finally:
+        if args.profile:
+            session.stop()
+            session.report()
+            session.export(args.profile_output)
 
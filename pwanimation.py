@@ -0,0 +1,214 @@
+from collections import deque
+from time import perf_counter
+
+import pwlogging
+
+
+class FrameStats:
+    '''Rolling record of recent frame times, used to judge whether a
+    composition is too heavy to animate live. Times are in seconds.'''
+
+    # Upper bounds (ms) of the histogram buckets; the last bucket is open.
+    bucket_bounds = (4, 8, 16, 33, 50, 100, 200)
+
+    def __init__(self, size=240):
+        self.frame_times = deque(maxlen=size)
+        self.frame_starts = deque(maxlen=size)
+        self.skipped = 0
+        self.overruns = 0
+
+    def reset(self):
+        self.frame_times.clear()
+        self.frame_starts.clear()
+        self.skipped = 0
+        self.overruns = 0
+
+    def record(self, start, frame_time, skipped=0, overrun=False):
+        '''Record one drawn frame which began at `start` and took
+        `frame_time`. `skipped` is the number of frame slots which passed
+        without being drawn.'''
+        self.frame_starts.append(start)
+        self.frame_times.append(frame_time)
+        self.skipped += skipped
+        if overrun:
+            self.overruns += 1
+
+    def fps(self):
+        '''Frames actually drawn per second over the window.'''
+        if len(self.frame_starts) < 2:
+            return 0.0
+        span = self.frame_starts[-1] - self.frame_starts[0]
+        if span <= 0:
+            return 0.0
+        return (len(self.frame_starts) - 1) / span
+
+    def mean_frame_time(self):
+        if not self.frame_times:
+            return 0.0
+        return sum(self.frame_times) / len(self.frame_times)
+
+    def percentile(self, pct):
+        '''Frame time at the given percentile (0-100) of the window.'''
+        if not self.frame_times:
+            return 0.0
+        ordered = sorted(self.frame_times)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+
+    def histogram(self):
+        '''Return a list of (upper bound in ms, count) pairs; the last
+        bound is None for frames slower than every other bucket.'''
+        counts = [0] * (len(self.bucket_bounds) + 1)
+        for frame_time in self.frame_times:
+            ms = frame_time * 1000
+            for i, bound in enumerate(self.bucket_bounds):
+                if ms <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return list(zip(self.bucket_bounds + (None,), counts))
+
+    def summary(self):
+        '''Snapshot of the stats as a dict of plain values.'''
+        return {
+            "frames": len(self.frame_times),
+            "fps": self.fps(),
+            "mean_ms": self.mean_frame_time() * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "max_ms": max(self.frame_times, default=0.0) * 1000,
+            "skipped": self.skipped,
+            "overruns": self.overruns,
+            "histogram": self.histogram(),
+            }
+
+
+class FrameScheduler:
+    '''Drive an animation at a target frame rate from an event loop.
+
+    draw_frame is called with the real time in seconds since start(), so
+    the animation advances by elapsed time however long frames take. After
+    each frame, the next one is scheduled for the remainder of the frame
+    interval; a frame which overruns its budget is followed immediately by
+    the next one, and any frame slots that passed in the meantime are
+    counted as skipped rather than drawn late.
+
+    schedule and cancel follow tkinter's after()/after_cancel() signatures,
+    e.g. FrameScheduler(draw, canvas.after, canvas.after_cancel).'''
+
+    def __init__(self, draw_frame, schedule, cancel=None, target_fps=30,
+            budget=None, stats=None, clock=perf_counter):
+        self.draw_frame = draw_frame
+        self.schedule = schedule
+        self.cancel = cancel
+        self.target_fps = target_fps
+        self.interval = 1 / target_fps
+        # time a frame may take before it counts as an overrun
+        self.budget = budget if budget is not None else self.interval
+        self.stats = stats if stats is not None else FrameStats()
+        self.clock = clock
+        self.running = False
+        self._pending = None
+
+    def start(self):
+        self.running = True
+        self._start_time = self.clock()
+        self._last_frame = None
+        self._tick()
+
+    def stop(self):
+        self.running = False
+        if self._pending is not None and self.cancel is not None:
+            self.cancel(self._pending)
+        self._pending = None
+
+    def _tick(self):
+        self._pending = None
+        if not self.running:
+            return
+        frame_start = self.clock()
+        skipped = 0
+        if self._last_frame is not None:
+            slots = int((frame_start - self._last_frame) / self.interval)
+            skipped = max(0, slots - 1)
+        self.draw_frame(frame_start - self._start_time)
+        frame_time = self.clock() - frame_start
+        overrun = frame_time > self.budget
+        self.stats.record(frame_start, frame_time, skipped, overrun)
+        if overrun:
+            pwlogging.trace("Frame over budget", frame_ms=frame_time * 1000,
+                    budget_ms=self.budget * 1000)
+        self._last_frame = frame_start
+        if self.running:
+            # Always yield at least a millisecond so input events get handled.
+            delay = max(1, int((self.interval - frame_time) * 1000))
+            self._pending = self.schedule(delay, self._tick)
+
+
+class OrbitClock:
+    '''Orbit time, in orbit ticks (tick_rate per second), advancing with
+    the given clock while running. Stopping freezes it; start() continues
+    from wherever it was frozen, and seek() jumps to a given time.'''
+
+    def __init__(self, tick_rate, clock=perf_counter):
+        self.tick_rate = tick_rate
+        self.clock = clock
+        self.running = False
+        self._base = 0.0
+        self._start_time = None
+
+    def ticks(self):
+        if not self.running:
+            return self._base
+        return self._base + (self.clock() - self._start_time) * self.tick_rate
+
+    def start(self):
+        if not self.running:
+            self._start_time = self.clock()
+            self.running = True
+
+    def stop(self):
+        self._base = self.ticks()
+        self.running = False
+
+    def seek(self, ticks):
+        self._base = ticks
+        if self.running:
+            self._start_time = self.clock()
+
+
+class ManualScheduler:
+    '''A stand-in for an event loop's after()/after_cancel(), for running
+    animations headlessly: time only passes when advance() is called, and
+    the callbacks which fall due are run then, in order. Pass its clock()
+    as the clock of a FrameScheduler or OrbitClock to keep them in step.'''
+
+    def __init__(self):
+        self.now = 0.0
+        self._pending = {}
+        self._ids = 0
+
+    def clock(self):
+        return self.now
+
+    def schedule(self, delay_ms, callback):
+        self._ids += 1
+        self._pending[self._ids] = (self.now + delay_ms / 1000, callback)
+        return self._ids
+
+    def cancel(self, callback_id):
+        self._pending.pop(callback_id, None)
+
+    def advance(self, seconds):
+        '''Move time forward by `seconds`, running every callback that
+        falls due on the way (including ones they schedule).'''
+        end = self.now + seconds
+        while self._pending:
+            callback_id, (due, callback) = min(self._pending.items(),
+                    key=lambda item: (item[1][0], item[0]))
+            if due > end:
+                break
+            del self._pending[callback_id]
+            self.now = max(self.now, due)
+            callback()
+        self.now = end
@@ -0,0 +1,139 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import glob
+import logging as log
+import os
+import sys
+from time import perf_counter
+
+import pwraster
+import pwvector
+from radialstructs import PanawaveStruct
+
+FORMATS = {
+    "png": ".png",
+    "svg": ".svg",
+    "ps": ".eps",
+    }
+
+
+def expand_inputs(patterns, unmatched=None):
+    '''Expand glob patterns (for shells which don't) into a sorted list of
+    files, keeping plain paths as given and dropping duplicates. Patterns
+    which match nothing are appended to unmatched, if given.'''
+    files = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                log.warning("No files match {0}".format(pattern))
+                if unmatched is not None:
+                    unmatched.append(pattern)
+            files.extend(matches)
+        else:
+            files.append(pattern)
+    seen = set()
+    return [f for f in files if not (f in seen or seen.add(f))]
+
+
+def output_path(input_file, format, output_dir=None):
+    '''Output file for an input: same name with the format's extension, in
+    output_dir if given, otherwise beside the input.'''
+    base = os.path.splitext(os.path.basename(input_file))[0] + FORMATS[format]
+    if output_dir is None:
+        output_dir = os.path.dirname(input_file)
+    return os.path.join(output_dir, base)
+
+
+def find_collisions(outputs):
+    '''Given a dict of input -> output file, return a dict of output ->
+    inputs for every output which more than one input would write.'''
+    inputs_by_output = {}
+    for input_file, output_file in outputs.items():
+        key = os.path.normcase(os.path.abspath(output_file))
+        inputs_by_output.setdefault(key, []).append(input_file)
+    return {outputs[inputs[0]]: inputs
+            for inputs in inputs_by_output.values() if len(inputs) > 1}
+
+
+def render_one(input_file, output_file, format, size=600, supersample=1):
+    '''Load one composition and render it. Runs in a worker process, so
+    returns (seconds taken, error message or None) rather than raising.'''
+    start = perf_counter()
+    try:
+        pw_struct = PanawaveStruct()
+        pw_struct.load_from_file(input_file)
+        if format == "png":
+            pwraster.render_to_png(pw_struct, output_file, width=size,
+                    supersample=supersample)
+        elif format == "svg":
+            pwvector.write_svg(pw_struct, output_file, width=size)
+        elif format == "ps":
+            pwvector.write_postscript(pw_struct, output_file, width=size)
+        else:
+            raise ValueError("Unknown format: {0}".format(format))
+    except Exception as e:
+        return perf_counter() - start, "{0}: {1}".format(type(e).__name__, e)
+    return perf_counter() - start, None
+
+
+def render_batch(inputs, format="png", output_dir=None, jobs=None, size=600,
+        supersample=1, stream=sys.stderr):
+    '''Render many compositions in parallel across a process pool, printing
+    progress and per-file timing to `stream`. Returns the number of files
+    which failed, counting each glob pattern which matched nothing as one.
+    Nothing is rendered if two inputs would be written to the same output
+    file (e.g. same-named files from different directories with
+    output_dir); every input involved counts as failed.'''
+    unmatched = []
+    files = expand_inputs(inputs, unmatched)
+    if not files:
+        print("No input files.", file=stream)
+        return max(1, len(unmatched))
+    outputs = {f: output_path(f, format, output_dir) for f in files}
+    collisions = find_collisions(outputs)
+    if collisions:
+        for output_file, clashing in sorted(collisions.items()):
+            print("{0} would be written by each of: {1}".format(output_file,
+                ", ".join(clashing)), file=stream)
+        print("Not rendering: some outputs would overwrite each other.",
+                file=stream)
+        return sum(len(clashing) for clashing in collisions.values())
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+    failures = 0
+    start = perf_counter()
+
+    def report(done, input_file, seconds, error):
+        if error is None:
+            print("[{0}/{1}] {2} -> {3} ({4:.2f}s)".format(done, len(files),
+                input_file, outputs[input_file], seconds), file=stream)
+        else:
+            print("[{0}/{1}] FAILED {2} ({3:.2f}s): {4}".format(done,
+                len(files), input_file, seconds, error), file=stream)
+
+    if jobs == 1:
+        for done, input_file in enumerate(files, start=1):
+            seconds, error = render_one(input_file, outputs[input_file],
+                    format, size, supersample)
+            failures += error is not None
+            report(done, input_file, seconds, error)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(render_one, f, outputs[f], format, size,
+                supersample): f for f in files}
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    seconds, error = future.result()
+                except BrokenProcessPool:
+                    # a worker died (e.g. killed for running out of
+                    # memory); every file not yet finished fails with it
+                    seconds, error = 0.0, "worker process terminated " \
+                            "before finishing"
+                failures += error is not None
+                report(done, futures[future], seconds, error)
+    print("Rendered {0} of {1} files in {2:.2f}s using {3} process(es).".format(
+        len(files) - failures, len(files), perf_counter() - start,
+        min(jobs, len(files))), file=stream)
+    return failures + len(unmatched)
@@ -0,0 +1,185 @@
+'''Compact binary container for Panawave compositions (.pwv).
+
+Layout, all little-endian:
+
+    header          HEADER (see below)
+    ring table      ring_count fixed-width RING records
+    scaler pool     scaler_count uint32 values; rings reference a slice
+    geometry index  geometry_count GEOMETRY records (data offset, vertices)
+    geometry data   float64 x, y pairs
+    state           persistent_state as UTF-8 JSON
+
+Identical scaler lists and base sticker polygons are stored once and shared
+by every ring that uses them. Because every table is fixed-width, any
+ring can be looked up directly by index without parsing the rest of the
+document.
+'''
+import json
+import logging as log
+from collections import namedtuple
+import struct
+
+MAGIC = b"PWV\x00"
+VERSION = 1
+
+# magic, version, header size, ring count, scaler count, geometry count,
+# then offsets of: ring table, scaler pool, geometry index, state;
+# and the length of the state
+HEADER = struct.Struct("<4sHHIIIQQQQQ")
+# id, radius, offset, count, scaler offset, scaler length, geometry id, flags
+RING = struct.Struct("<QddIIIiI")
+# data offset, vertex count
+GEOMETRY = struct.Struct("<QI")
+SCALER = struct.Struct("<I")
+POINT = struct.Struct("<dd")
+
+Header = namedtuple("Header", "magic version header_size ring_count "
+        "scaler_count geometry_count ring_table_offset scaler_pool_offset "
+        "geometry_index_offset state_offset state_length")
+RingRecord = namedtuple("RingRecord", "id radius offset count scaler_offset "
+        "scaler_length geometry_id flags")
+
+FILE_EXTENSIONS = (".pwv",)
+
+
+def is_binary_path(path):
+    '''True if the path's extension selects the binary format on save.'''
+    return str(path).lower().endswith(FILE_EXTENSIONS)
+
+
+def is_binary_file(path):
+    '''True if the file starts with the .pwv magic. Files saved by earlier
+    versions with a .pwv extension are JSON, so loading checks this rather
+    than the extension alone.'''
+    with open(path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def write_pwv(pw_struct, file):
+    '''Write a PanawaveStruct to an open binary file.'''
+    scaler_pool = []
+    scaler_offsets = {}
+    geometry_pool = []
+    geometry_ids = {}
+    ring_records = []
+    for ring in pw_struct.ring_array.values():
+        scalers = tuple(int(s) for s in ring.scaler_list)
+        if scalers not in scaler_offsets:
+            scaler_offsets[scalers] = len(scaler_pool)
+            scaler_pool.extend(scalers)
+        geometry = tuple((float(x), float(y)) for x, y in ring.baseStickerPoly)
+        if geometry not in geometry_ids:
+            geometry_ids[geometry] = len(geometry_pool)
+            geometry_pool.append(geometry)
+        ring_records.append(RING.pack(int(ring.id), ring.radius,
+            ring.offsetDegrees, ring.count, scaler_offsets[scalers],
+            len(scalers), geometry_ids[geometry], 0))
+    state = json.dumps(pw_struct.saved_state(), sort_keys=True).encode()
+
+    ring_table_offset = HEADER.size
+    scaler_pool_offset = ring_table_offset + RING.size * len(ring_records)
+    geometry_index_offset = scaler_pool_offset + SCALER.size * len(scaler_pool)
+    geometry_data_offset = geometry_index_offset + \
+            GEOMETRY.size * len(geometry_pool)
+    geometry_index = []
+    data_offset = geometry_data_offset
+    for geometry in geometry_pool:
+        geometry_index.append(GEOMETRY.pack(data_offset, len(geometry)))
+        data_offset += POINT.size * len(geometry)
+    state_offset = data_offset
+
+    file.write(HEADER.pack(MAGIC, VERSION, HEADER.size, len(ring_records),
+        len(scaler_pool), len(geometry_pool), ring_table_offset,
+        scaler_pool_offset, geometry_index_offset, state_offset, len(state)))
+    file.write(b"".join(ring_records))
+    file.write(struct.pack("<{0}I".format(len(scaler_pool)), *scaler_pool))
+    file.write(b"".join(geometry_index))
+    for geometry in geometry_pool:
+        file.write(b"".join(POINT.pack(x, y) for x, y in geometry))
+    file.write(state)
+    log.debug("Wrote {0} rings, {1} scaler values and {2} geometries "
+            "to .pwv".format(len(ring_records), len(scaler_pool),
+                len(geometry_pool)))
+
+
+class PWVReader:
+    '''Random-access reader for .pwv files. The file is read into memory
+    in one go, since loading a document uses every ring in it anyway;
+    nothing beyond the header is decoded until it is asked for.'''
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self._data = file.read()
+        if len(self._data) < HEADER.size:
+            raise ValueError("{0} is not a .pwv file".format(path))
+        self.header = Header(*HEADER.unpack_from(self._data, 0))
+        if self.header.magic != MAGIC:
+            raise ValueError("{0} is not a .pwv file".format(path))
+        if self.header.version > VERSION:
+            raise ValueError("{0} was written by a newer version (format "
+                    "{1})".format(path, self.header.version))
+        # the state is written last, so this also covers every table
+        if self.header.state_offset + self.header.state_length > \
+                len(self._data):
+            raise ValueError("{0} is truncated".format(path))
+        self._geometry_cache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._data = None
+
+    def __len__(self):
+        return self.header.ring_count
+
+    def ring_record(self, index):
+        '''Return the RingRecord at the given position in the ring table.'''
+        if not 0 <= index < self.header.ring_count:
+            raise IndexError(index)
+        return RingRecord(*RING.unpack_from(self._data,
+            self.header.ring_table_offset + index * RING.size))
+
+    def ring_records(self):
+        '''Iterate over every RingRecord in table order.'''
+        for index in range(self.header.ring_count):
+            yield RingRecord(*RING.unpack_from(self._data,
+                self.header.ring_table_offset + index * RING.size))
+
+    def scaler_list(self, record):
+        start = self.header.scaler_pool_offset + \
+                record.scaler_offset * SCALER.size
+        return list(struct.unpack_from("<{0}I".format(record.scaler_length),
+            self._data, start))
+
+    def geometry(self, geometry_id):
+        '''Return a base sticker polygon from the geometry pool as a new
+        list of [x, y] points. The decoded points are cached, as many rings
+        share one.'''
+        if geometry_id not in self._geometry_cache:
+            data_offset, vertex_count = GEOMETRY.unpack_from(self._data,
+                    self.header.geometry_index_offset +
+                    geometry_id * GEOMETRY.size)
+            self._geometry_cache[geometry_id] = tuple(POINT.iter_unpack(
+                    self._data[data_offset:
+                        data_offset + vertex_count * POINT.size]))
+        return [list(point) for point in self._geometry_cache[geometry_id]]
+
+    def persistent_state(self):
+        start = self.header.state_offset
+        return json.loads(
+                self._data[start:start + self.header.state_length].decode())
+
+    def ring_kwargs(self, record):
+        '''StickerRing arguments for a RingRecord.'''
+        return {
+            "id": record.id,
+            "radius": record.radius,
+            "count": record.count,
+            "offsetDegrees": record.offset,
+            "scaler_list": self.scaler_list(record),
+            "geometry": self.geometry(record.geometry_id),
+            }
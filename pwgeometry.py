@@ -0,0 +1,235 @@
+from collections import OrderedDict
+from math import sin, cos, hypot, radians
+
+# NumPy is optional; without it the same geometry is computed with plain
+# python lists, which is considerably slower for large rings.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Can be set to False to force the pure-python path, e.g. for comparison.
+use_numpy = numpy is not None
+
+
+def full_scaler_sum(count, scaler_list):
+    '''Sum of the scaler_list as repeated over `count` stickers, without
+    building the repeated list.'''
+    period = len(scaler_list)
+    cycles, remainder = divmod(count, period)
+    return cycles * sum(scaler_list) + sum(scaler_list[:remainder])
+
+
+def angular_offsets(count, scaler_list, increment):
+    '''Return the angular position (degrees, relative to the ring offset) of
+    each sticker. Sticker k sits at increment * (s[0] + ... + s[k]), matching
+    the cumulative stepping StickerRing has always used.'''
+    period = len(scaler_list)
+    if use_numpy:
+        steps = numpy.resize(numpy.asarray(scaler_list, dtype=float), count)
+        return numpy.cumsum(steps) * increment
+    offsets = []
+    position = 0
+    for i in range(count):
+        position += scaler_list[i % period]
+        offsets.append(position * increment)
+    return offsets
+
+
+def centered_base(base_poly):
+    '''Return the base polygon translated so its centroid (the mean of its
+    points, as PanawavePolygon calculates it) sits on the origin.'''
+    xmean = sum(p[0] for p in base_poly) / len(base_poly)
+    ymean = sum(p[1] for p in base_poly) / len(base_poly)
+    return [(p[0] - xmean, p[1] - ymean) for p in base_poly]
+
+
+def bounding_radius(base_poly):
+    '''Distance from the base polygon's centroid to its farthest point, i.e.
+    how far a sticker can reach from its position on the ring.'''
+    return max(hypot(x, y) for x, y in centered_base(base_poly))
+
+
+def ring_geometry(base_poly, radius, count, offset, scaler_list, increment):
+    '''Compute every sticker of a ring in one pass.
+
+    Returns (vertices, centroids). With numpy these are arrays of shape
+    (count, n_vertices, 2) and (count, 2); otherwise they are nested lists
+    of (x, y) tuples with the same layout. Each sticker is the base polygon
+    centered on the origin, moved out along the positive Y axis by `radius`
+    and rotated about the origin by offset + its angular offset.
+
+    The arrays returned are read-only (tuples without numpy), as they may
+    be shared between rings through the GeometryCache.'''
+    base = centered_base(base_poly)
+    angles = angular_offsets(count, scaler_list, increment)
+    if use_numpy:
+        theta = numpy.radians(angles + offset)[:, None]
+        cos_t, sin_t = numpy.cos(theta), numpy.sin(theta)
+        base_arr = numpy.asarray(base, dtype=float)
+        bx = base_arr[None, :, 0]
+        by = base_arr[None, :, 1] + radius
+        vertices = numpy.empty((count, len(base), 2))
+        vertices[:, :, 0] = bx * cos_t - by * sin_t
+        vertices[:, :, 1] = bx * sin_t + by * cos_t
+        centroids = numpy.empty((count, 2))
+        centroids[:, 0] = -radius * sin_t[:, 0]
+        centroids[:, 1] = radius * cos_t[:, 0]
+        vertices.flags.writeable = False
+        centroids.flags.writeable = False
+        return vertices, centroids
+    vertices = []
+    centroids = []
+    for angle in angles:
+        theta = radians(angle + offset)
+        cos_t, sin_t = cos(theta), sin(theta)
+        vertices.append(tuple((bx * cos_t - (by + radius) * sin_t,
+                               bx * sin_t + (by + radius) * cos_t)
+                              for bx, by in base))
+        centroids.append((-radius * sin_t, radius * cos_t))
+    return tuple(vertices), tuple(centroids)
+
+
+def rotate_vertices(vertices, angle):
+    '''Return a copy of a ring's vertices rotated about the origin by `angle`
+    degrees. The input is not modified.'''
+    theta = radians(angle)
+    cos_t, sin_t = cos(theta), sin(theta)
+    if use_numpy and isinstance(vertices, numpy.ndarray):
+        rotated = numpy.empty_like(vertices)
+        x, y = vertices[..., 0], vertices[..., 1]
+        rotated[..., 0] = x * cos_t - y * sin_t
+        rotated[..., 1] = x * sin_t + y * cos_t
+        return rotated
+    return [[(x * cos_t - y * sin_t, x * sin_t + y * cos_t)
+             for x, y in sticker] for sticker in vertices]
+
+
+def flat_coords(vertices):
+    '''Return a list of flat [x0, y0, x1, y1, ...] coordinate lists, one per
+    sticker, as accepted by tkinter's create_polygon and coords.'''
+    if use_numpy and isinstance(vertices, numpy.ndarray):
+        return vertices.reshape(len(vertices), -1).tolist()
+    return [[c for point in sticker for c in point] for sticker in vertices]
+
+
+def geometry_size(geometry):
+    '''Approximate memory used by a (vertices, centroids) pair, in bytes.'''
+    vertices, centroids = geometry
+    if use_numpy and isinstance(vertices, numpy.ndarray):
+        return vertices.nbytes + centroids.nbytes
+    if not vertices:
+        return 0
+    # a float is 24 bytes, a 2-tuple 56, plus 8 per reference in each tuple
+    per_point = 2 * 24 + 56 + 8
+    return len(vertices) * (len(vertices[0]) * per_point + 56 + 8) + \
+            len(centroids) * per_point
+
+
+class GeometryCache:
+    '''Bounded LRU cache of computed ring geometry, shared by every ring (and
+    every document) in the process. Entries are keyed on everything the
+    geometry depends on: base polygon, radius, count, offset and
+    scaler_list. When a slider is scrubbed back over values it visited a
+    moment ago, the geometry comes from here rather than being recomputed.
+
+    Entries are evicted least-recently-used first once their total size
+    exceeds max_bytes; a max_bytes of 0 disables caching.'''
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ring_geometry(self, base_poly, radius, count, offset, scaler_list,
+            increment):
+        '''Cached equivalent of the module-level ring_geometry.'''
+        key = (tuple(tuple(point) for point in base_poly), float(radius),
+                int(count), float(offset), tuple(scaler_list), use_numpy)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        geometry = ring_geometry(base_poly, radius, count, offset,
+                scaler_list, increment)
+        size = geometry_size(geometry)
+        if size <= self.max_bytes:
+            self._entries[key] = (geometry, size)
+            self.bytes += size
+            self._evict()
+        return geometry
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._entries:
+            key, (geometry, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def set_max_bytes(self, max_bytes):
+        '''Change the memory cap, evicting entries if necessary.'''
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def clear(self):
+        '''Drop every entry and start the hit, miss and eviction counts
+        afresh.'''
+        self._entries.clear()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hit_rate(), "evictions": self.evictions,
+                "entries": len(self._entries), "bytes": self.bytes,
+                "max_bytes": self.max_bytes}
+
+
+# The process-wide cache used by StickerRing.
+geometry_cache = GeometryCache()
+
+
+class StickerListView:
+    '''Read-only sequence over a ring's computed geometry, presenting each
+    sticker as a PanawavePolygon for code written against the old
+    StickerRing.sticker_list. Polygons are created on access, so modifying
+    one will not affect the ring; use the StickerRing setters instead.'''
+
+    def __init__(self, vertices, centroids, polygon_class):
+        self._vertices = vertices
+        self._centroids = centroids
+        self._polygon_class = polygon_class
+
+    def __len__(self):
+        return len(self._vertices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        points = [tuple(p) for p in self._vertices[index]]
+        centroid = tuple(self._centroids[index])
+        return self._polygon_class(points, centroid=centroid)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _as_json(self):
+        '''Same layout pw_json_serializer produced for a list of
+        PanawavePolygons.'''
+        return [{"centroid": [float(c) for c in centroid],
+                 "points": [[float(x), float(y)] for x, y in points]}
+                for points, centroid in zip(self._vertices, self._centroids)]
@@ -0,0 +1,200 @@
+'''Analytic hit-testing of stickers.
+
+Every sticker sits at a known radius and angle, so a canvas point can be
+resolved to a sticker without asking Tk which item is under the cursor, and
+without computing any ring's geometry: the point is converted to polar
+coordinates, candidate rings are found by binary search on radius (see
+RingRegistry.in_radius_range), candidate stickers by the angular slot the
+point falls in, and the point is then tested against each candidate in the
+sticker's own frame.
+
+Angles follow StickerRing: a point at angle a and distance r from the origin
+is (-r sin a, r cos a) on the canvas, and sticker k of a ring sits at
+displayed_offset + increment * (s[0] + ... + s[k]) for its scaler_list s.
+'''
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import accumulate
+from math import asin, acos, atan2, cos, degrees, floor, hypot, radians, sin
+
+import pwgeometry
+
+
+def polar(x, y):
+    '''Distance and angle (degrees, in [0, 360)) of a canvas point.'''
+    return hypot(x, y), degrees(atan2(-x, y)) % 360
+
+
+@lru_cache(maxsize=64)
+def _centered_base(base_poly):
+    return tuple(pwgeometry.centered_base(base_poly))
+
+
+def _cumulative(scaler_list):
+    return list(accumulate(scaler_list))
+
+
+def sticker_slots(ring, low, high):
+    '''Indices of the ring's stickers whose angle relative to the ring's
+    displayed offset lies within [low, high] degrees. Only rotations of
+    stickers around the circle are considered, so low and high may extend
+    past 0 and 360.'''
+    for k, angle in _slot_angles(ring, low, high):
+        yield k
+
+
+def _slot_angles(ring, low, high):
+    '''As sticker_slots, yielding (index, angle relative to the offset).'''
+    if ring.count <= 0:
+        return
+    increment = ring.increment
+    period = len(ring.scaler_list)
+    cumulative = _cumulative(ring.scaler_list)
+    period_sum = cumulative[-1]
+    turn = 360 / increment # one turn, in scaler units
+    low, high = low / increment, high / increment
+    # Sticker positions repeat every turn; visit each turn the range spans.
+    for turns in range(floor(low / turn) - 1, floor(high / turn) + 1):
+        start = low - turns * turn
+        end = high - turns * turn
+        cycles = max(0, floor(start / period_sum))
+        j = bisect_left(cumulative, start - cycles * period_sum)
+        k = cycles * period + j
+        while k < ring.count:
+            position = (k // period) * period_sum + cumulative[k % period]
+            if position > end:
+                break
+            if position >= start:
+                yield k, position * increment
+            k += 1
+
+
+def sticker_angle(ring, k):
+    '''Displayed angle of sticker k, in degrees.'''
+    period = len(ring.scaler_list)
+    cumulative = _cumulative(ring.scaler_list)
+    position = (k // period) * cumulative[-1] + cumulative[k % period]
+    return ring.displayed_offset() + ring.increment * position
+
+
+def sticker_contains(ring, k, x, y):
+    '''True if canvas point (x, y) lies inside sticker k of the ring.'''
+    return _contains(ring.radius, sticker_angle(ring, k), x, y,
+            _base_of(ring))
+
+
+def _base_of(ring):
+    return _centered_base(tuple(map(tuple, ring.baseStickerPoly)))
+
+
+def _contains(radius, angle, x, y, base):
+    theta = radians(angle)
+    cos_t, sin_t = cos(theta), sin(theta)
+    # rotate the point back by theta and move it to the base sticker's frame
+    bx = x * cos_t + y * sin_t
+    by = -x * sin_t + y * cos_t - radius
+    return point_in_polygon(bx, by, base)
+
+
+def point_in_polygon(x, y, points):
+    '''Even-odd rule point in polygon test.'''
+    inside = False
+    x1, y1 = points[-1]
+    for x2, y2 in points:
+        if (y1 > y) != (y2 > y) and \
+                x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+def _angular_reach(reach, distance):
+    '''Largest angle (degrees) between a point at `distance` from the origin
+    and the position of a sticker which can contain it.'''
+    if distance <= reach:
+        return 180.0
+    return degrees(asin(reach / distance))
+
+
+def _ring_hits(ring, x, y, angle, window):
+    '''Indices of the ring's stickers containing (x, y), which lies at
+    `angle`; only stickers within `window` degrees of it are tested.'''
+    offset = ring.displayed_offset()
+    relative = (angle - offset) % 360
+    base = _base_of(ring)
+    for k, position in _slot_angles(ring, relative - window,
+            relative + window):
+        if _contains(ring.radius, offset + position, x, y, base):
+            yield k
+
+
+def _candidates(ring_array, x, y):
+    distance, angle = polar(x, y)
+    reach = ring_array.max_sticker_reach
+    rings = ring_array.in_radius_range(distance - reach, distance + reach)
+    return rings, angle, _angular_reach(reach, distance)
+
+
+def hits(ring_array, x, y):
+    '''Every (ring, sticker index) whose sticker contains canvas point
+    (x, y), in no particular order.'''
+    rings, angle, window = _candidates(ring_array, x, y)
+    return [(ring, k) for ring in rings
+            for k in _ring_hits(ring, x, y, angle, window)]
+
+
+def hit_test(ring_array, x, y):
+    '''The topmost ring with a sticker containing canvas point (x, y), or
+    None. Candidate rings are tested from the top down, stopping at the
+    first hit.'''
+    rings, angle, window = _candidates(ring_array, x, y)
+    rings.sort(key=ring_array.draw_order, reverse=True)
+    for ring in rings:
+        if next(_ring_hits(ring, x, y, angle, window), None) is not None:
+            return ring
+    return None
+
+
+def _arcs_in_rect(radius, x0, y0, x1, y1):
+    '''Angular intervals (degrees) of the circle of the given radius which
+    lie inside the rectangle.'''
+    crossings = {0.0, 360.0}
+    for edge in (x0, x1):
+        if abs(edge) <= radius:
+            a = degrees(asin(-edge / radius))
+            crossings.update((a % 360, (180 - a) % 360))
+    for edge in (y0, y1):
+        if abs(edge) <= radius:
+            a = degrees(acos(edge / radius))
+            crossings.update((a % 360, -a % 360))
+    crossings = sorted(crossings)
+    arcs = []
+    for start, end in zip(crossings, crossings[1:]):
+        middle = radians((start + end) / 2)
+        mx, my = -radius * sin(middle), radius * cos(middle)
+        if x0 <= mx <= x1 and y0 <= my <= y1:
+            if arcs and arcs[-1][1] == start:
+                arcs[-1] = (arcs[-1][0], end)
+            else:
+                arcs.append((start, end))
+    return arcs
+
+
+def rings_in_rect(ring_array, x0, y0, x1, y1):
+    '''Rings with at least one sticker centered inside the rectangle with
+    corners (x0, y0) and (x1, y1), for rubber-band selection.'''
+    x0, x1 = min(x0, x1), max(x0, x1)
+    y0, y1 = min(y0, y1), max(y0, y1)
+    nearest = hypot(max(x0, 0, -x1), max(y0, 0, -y1))
+    farthest = max(hypot(x, y) for x in (x0, x1) for y in (y0, y1))
+    found = []
+    for ring in ring_array.in_radius_range(nearest, farthest):
+        if ring.radius <= 0:
+            continue
+        offset = ring.displayed_offset()
+        for start, end in _arcs_in_rect(ring.radius, x0, y0, x1, y1):
+            if next(sticker_slots(ring, start - offset, end - offset),
+                    None) is not None:
+                found.append(ring)
+                break
+    return found
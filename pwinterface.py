@@ -1,24 +1,21 @@
 import logging as log
 import tkinter
-# TODO will be deprecating the toplevel import below in favor of above
-# to clean up our namespace
-from tkinter import *
+from tkinter import CURRENT, FALSE, Menu
 from tkinter.filedialog import askopenfilename, asksaveasfilename
-from tkinter.ttk import Treeview, Style
-from tkinter import ttk
-from math import degrees, radians
-from cmath import exp
-from random import random
-from time import sleep
+from tkinter.ttk import Style
 from copy import deepcopy
-import json
-import os
-import sys
-# Debugging console
-from IPython import embed
 
-from radialstructs import *
-from pwwidgets import *
+from radialstructs import PanawaveStruct
+from pwwidgets import (PWAnimController, PWButton, PWConsole, PWController,
+        PWHud, PWPeriodController, PWRedrawScheduler, PWViewer, PWWidget)
+
+
+def embed(**kwargs):
+    '''Start an IPython debugging console. IPython is only imported when
+    this is called, as it takes longer to import than the rest of the
+    editor.'''
+    import IPython
+    IPython.embed(**kwargs)
 
 
 class PanawaveApp:
@@ -54,7 +51,6 @@ class PanawaveApp:
         # inherited by all PWWidgets. This greatly simplifies widget
         # instantiation.
         PWWidget.pwapp = self
-        self.pw_interface_selected_rings = []
         self.create_ui()
         self.working_struct = self.load_new_struct(file,
                 target_canvas=self.viewer.pw_canvas)
@@ -91,6 +87,13 @@ class PanawaveApp:
 
         # MAIN VIEW:
         self.viewer = PWViewer()
+        # Slider motion and other rapid updates are coalesced and applied
+        # once per idle cycle; see PWRedrawScheduler.
+        self.redraw_scheduler = PWRedrawScheduler(master.after_idle)
+        self.redraw_scheduler.register_view("canvas",
+                self.viewer._rebuild_pw_canvas)
+        self.redraw_scheduler.register_view("list",
+                self.viewer._rebuild_pw_list)
 
         # CANVAS
         self.viewer.create_canvas(row=0, column=0, rowspan=5)
@@ -108,11 +111,21 @@ class PanawaveApp:
         # however, and anyway the current method behaves well with polygon
         # objects.  Currently investigating use of .pack() geom. manager,
         # instead.
+        # UPDATE: StickerRings now retain their canvas items and only move
+        # them on redraw, so the canvas is no longer cleared; create_window
+        # may be worth revisiting.
 
         self.console = PWConsole(master=self.viewer.pw_canvas)
         self.console_button = PWButton(self.viewer.pw_canvas, text=">",
                 width=2, command=self.console.toggle_console)
         self.console_button.place(relx=0.02, rely=.92)
+        self.hud = PWHud(master=self.viewer.pw_canvas)
+        self.hud_button = PWButton(self.viewer.pw_canvas, text="%",
+                width=2, command=self.hud.toggle_hud)
+        self.hud_button.place(relx=0.02, rely=.85)
+        self.overlaps_button = PWButton(self.viewer.pw_canvas, text="!",
+                width=2, command=self.viewer.toggle_overlaps)
+        self.overlaps_button.place(relx=0.02, rely=.78)
                 # This is currently broken; the geom. of the parent window
                 # currently seems to be larger than the actual geometry drawn,
                 # and thus rel. values are not drawing where expected and don't
@@ -164,7 +177,8 @@ class PanawaveApp:
     def open_file(self):
         '''gets filename with standard tk dialog then calls load_new_struct'''
         filename = askopenfilename(defaultextension=".pwv")
-        if filename is None:
+        # the dialog returns an empty string (or tuple) when cancelled
+        if not filename:
             return
         else:
             self.load_new_struct(file=filename)
@@ -180,13 +194,33 @@ class PanawaveApp:
         '''create an empty struct, attach it to the canvas,
         and populate it from a file if one is given.'''
         self.selected_ring = None
+        if target_canvas is None:
+            target_canvas = self.viewer.pw_canvas
+        # The canvas is no longer cleared on every redraw, so the outgoing
+        # struct's items have to be removed explicitly.
+        if getattr(self, "working_struct", None) is not None:
+            self.working_struct.stop_animation()
+            self.working_struct.clear_canvas(target_canvas)
+            self.viewer.detach(self.working_struct)
+            self.pw_controller.detach(self.working_struct)
+            self.hud.detach(self.working_struct)
         self.working_struct = PanawaveStruct(canvas=target_canvas)
         if file is not None:
             self.working_struct.load_from_file(file)
-        self.working_struct.draw()
-        self.rebuild_views()
+        # From here on the views follow the struct's change events.
+        self.viewer.attach(self.working_struct)
+        self.pw_controller.attach(self.working_struct)
+        self.hud.attach(self.working_struct)
         return self.working_struct
 
+    @property
+    def pw_interface_selected_rings(self):
+        '''The selected rings of the working_struct. Selection is tracked by
+        its RingRegistry, so this is never out of step with the rings.'''
+        if getattr(self, "working_struct", None) is None:
+            return []
+        return self.working_struct.ring_array.selected_rings()
+
     def _update_clicked_canvas_item(self, event):
         '''Bound to clicks on the pw_canvas. Checks for the tk 'CURRENT' tag,
         which represents an item under the cursor, then update the
@@ -215,17 +249,16 @@ class PanawaveApp:
                     "an object.")
 
     def rebuild_views(self):
-        '''Rebuild the pw_list_box from the current contents of working_struct.
-        ring_array .'''
-        self.viewer.rebuild()
+        '''Rebuild the canvas and pw_list_box from the current contents of
+        working_struct.ring_array. The rebuild is deferred to the next idle
+        cycle, so repeated calls within one cycle rebuild only once.'''
+        self.redraw_scheduler.invalidate()
 
     def clear_selection(self):
         '''Clear selection state of working_struct as well as PWViewer and
         PWController'''
         self.working_struct.clear_selection()
         self.pw_controller.clear_inputs()
-        self.viewer.rebuild() # really entirely unneccesary to rebuild the list
-            # here as well but...does it matter?
 
     def set_selection(ringlist):
         '''Set selection state of working_struct and update interface elements
@@ -240,6 +273,13 @@ class PanawaveApp:
             self.pw_controller.clear_inputs()
             self.pw_controller.disable()
 
+    def animation_stats(self):
+        '''Summary of recent orbit animation frame times (fps, mean and p95
+        frame time, skipped frames and a frame-time histogram). Useful from
+        the console to check whether a composition is too heavy to animate
+        live.'''
+        return self.working_struct.frame_stats.summary()
+
     def spawn_period_dialog(self):
         '''Creates a PWPeriodDialog window and waits for it to return.'''
         log.debug("Spawning a PWPeriodDialog and waiting for its return...")
@@ -260,8 +300,8 @@ class PWPeriodDialog(tkinter.Toplevel, PWWidget):
             self.prior_scaler_states.append(deepcopy(r.scaler_list))
         log.debug("Stashed scaler_list states prior to spawning period "
                 "dialog: {0}".format(repr(self.prior_scaler_states)))
-        self.prior_locked_ring_list_state = deepcopy(
-                self.pwapp.working_struct.persistent_state['unlocked_rings'])
+        self.prior_locked_ring_list_state = set(
+                self.pwapp.working_struct.ring_array.unlocked)
         log.debug("Stashed unlocked_rings list prior to spawning period "
                 "dialog: {0}".format(repr(self.prior_locked_ring_list_state)))
 
@@ -321,7 +361,7 @@ class PWPeriodDialog(tkinter.Toplevel, PWWidget):
             log.debug("Resetting scaler_list of ring {0} to prior "
                     "value: {1}".format(repr(ring), repr(prior_state)))
             ring.set_scaler_list(prior_state)
-        self.pwapp.working_struct.persistent_state['unlocked_rings'] = \
+        self.pwapp.working_struct.ring_array.unlocked = \
                 self.prior_locked_ring_list_state
         self.pwapp.viewer._rebuild_pw_canvas()
         self.destroy()
@@ -1,11 +1,105 @@
+'''Logging setup, and a TRACE level for hot paths.
+
+Debug messages in code which runs per frame, per ring or per slider event
+should go through trace() rather than logging.debug(): it costs a single
+flag check while tracing is off, and its message is only formatted if a
+handler actually emits the record. Where even building the arguments is
+too costly, guard the call with `if pwlogging.tracing:`.
+'''
+import atexit
 import logging
 
-def create_logger(level=logging.DEBUG):
-    '''Instantiate and configure the logger.'''
+TRACE = 5
+logging.addLevelName(TRACE, "TRACE")
+
+LEVELS = ("trace", "debug", "info", "warning", "error", "critical")
+
+# True while the root logger is enabled for TRACE; kept up to date by
+# create_logger and set_level.
+tracing = False
+
+_listener = None
+
+
+class _Event:
+    '''A trace message, formatted as "event key=value ..." only when it is
+    emitted.'''
+
+    __slots__ = ("event", "fields")
+
+    def __init__(self, event, fields):
+        self.event = event
+        self.fields = fields
+
+    def __str__(self):
+        if not self.fields:
+            return self.event
+        return self.event + " " + " ".join("{0}={1!r}".format(key, value)
+                for key, value in self.fields.items())
+
+
+def trace(event, **fields):
+    '''Log an event at TRACE level, with keyword fields which are kept on
+    the record as record.fields for structured handlers.'''
+    if tracing:
+        logging.getLogger().log(TRACE, _Event(event, fields),
+                extra={"fields": fields}, stacklevel=2)
+
+
+def parse_level(name):
+    '''Level number for a name from LEVELS (any case) or a number.'''
+    if str(name).isdigit():
+        return int(name)
+    name = str(name).lower()
+    if name not in LEVELS:
+        raise ValueError("Unknown log level: {0}".format(name))
+    return logging.getLevelName(name.upper())
+
+
+def set_level(level):
+    '''Change the root logger's level, accepting anything parse_level
+    does.'''
+    global tracing
+    if not isinstance(level, int):
+        level = parse_level(level)
+    logging.getLogger().setLevel(level)
+    tracing = logging.getLogger().isEnabledFor(TRACE)
+
+
+def create_logger(level=logging.DEBUG, queued=False):
+    '''Instantiate and configure the logger. With queued, records are
+    handed to a QueueHandler and written out by a QueueListener thread, so
+    logging never blocks the caller (e.g. the Tk event loop) on output.'''
+    global _listener
     fmt="%(asctime)s (%(levelname)s): %(message)s <%(funcName)s, %(module)s:%(lineno)d>"
     datefmt="%H:%M:%S"
-    logging.basicConfig(
-            format=fmt,
-            datefmt=datefmt,
-            level=level)
+    if queued:
+        # only needed here, and slow to import (logging.handlers pulls in
+        # the socket and email modules)
+        from logging.handlers import QueueHandler, QueueListener
+        import queue
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter(fmt, datefmt))
+        records = queue.SimpleQueue()
+        _listener = QueueListener(records, stream,
+                respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop)
+        handler = QueueHandler(records)
+        # records are formatted by the listener's handler
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logging.basicConfig(handlers=[handler])
+    else:
+        logging.basicConfig(
+                format=fmt,
+                datefmt=datefmt)
+    set_level(level)
     logging.debug("Logging started!")
+
+
+def stop():
+    '''Flush and stop the queued sink, if create_logger started one.'''
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,234 @@
+'''Seamless-loop animation cache for orbits.
+
+A ring of `cycles` repetitions of its scaler_list looks the same after
+turning by 360 / cycles degrees (its symmetry angle, see symmetry_angle), so
+a ring orbiting at a constant rate repeats after symmetry angle / rate
+ticks, and a whole orbit repeats after the least common multiple of its
+rings' periods. When the rates are exact fractions (as the linear orbits'
+are) that period is found directly; otherwise (random orbits) the shortest
+loop is searched for in which every ring makes a whole number of symmetry
+turns, with its speed changing by no more than `tolerance` to get there.
+Either way each ring turns a whole number of times per loop, so the loop is
+seamless.
+
+One loop of keyframes is then stored: a uint16 phase per ring per frame, as
+a fraction of the ring's symmetry angle. Large caches are spilled to a
+memory-mapped temporary file rather than kept in memory. Playing a frame
+back only sets each ring's orbit rotation from its keyframe; rings whose
+keyframe did not change are left alone, so renderers skip them.
+'''
+from fractions import Fraction
+import logging as log
+from math import ceil, gcd
+import mmap
+import tempfile
+
+import pwgeometry
+from pwgeometry import numpy
+
+PHASE_STEPS = 1 << 16
+
+
+def symmetry_angle(ring):
+    '''Smallest rotation (degrees) which leaves the ring looking the same:
+    one repetition of its scaler_list, if the count holds a whole number of
+    them, otherwise a full turn.'''
+    period = len(ring.scaler_list)
+    if ring.count <= 0 or ring.count % period:
+        return 360.0
+    return 360.0 * period / ring.count
+
+
+def _rates(pw_struct):
+    '''(key, rate in degrees per orbit tick, symmetry angle) of every
+    ring.'''
+    master_speed = pw_struct.persistent_state["master_orbit_speed"]
+    return [(key, getattr(ring, "radial_speed", 0) * master_speed,
+            symmetry_angle(ring))
+            for key, ring in pw_struct.ring_array.items()]
+
+
+def exact_period(rates, max_denominator=10000):
+    '''The loop period in ticks, as a Fraction, if every moving ring's
+    period is an exact fraction with a denominator no larger than
+    max_denominator; otherwise None.'''
+    period = None
+    for key, rate, symmetry in rates:
+        if not rate:
+            continue
+        ring_period = symmetry / abs(rate)
+        fraction = Fraction(ring_period).limit_denominator(max_denominator)
+        if abs(fraction - ring_period) > 1e-9 * ring_period:
+            return None
+        if period is None:
+            period = fraction
+        else:
+            # lcm(a/b, c/d) = lcm(a, c) / gcd(b, d)
+            numerator = period.numerator * fraction.numerator // gcd(
+                    period.numerator, fraction.numerator)
+            period = Fraction(numerator,
+                    gcd(period.denominator, fraction.denominator))
+    return period
+
+
+def _turn_errors(rates, periods):
+    '''For each candidate loop period (ticks), the largest relative speed
+    change any moving ring needs to make a whole number of symmetry turns
+    in it.'''
+    moving = [(rate, symmetry) for key, rate, symmetry in rates if rate]
+    if pwgeometry.use_numpy:
+        rate, symmetry = numpy.array(moving, dtype=float).reshape(-1, 2).T
+        exact = numpy.outer(periods, rate / symmetry)
+        errors = numpy.abs(exact - numpy.round(exact)) / numpy.abs(exact)
+        return errors.max(axis=1, initial=0.0)
+    errors = []
+    for period in periods:
+        turns = [period * rate / symmetry for rate, symmetry in moving]
+        errors.append(max((abs(turn - round(turn)) / abs(turn)
+            for turn in turns), default=0.0))
+    return errors
+
+
+def find_loop(rates, ticks_per_frame, max_frames, tolerance=0.01):
+    '''Choose a loop for rings turning at the given rates: returns (frame
+    count, period in ticks, largest relative speed change). The exact
+    period is used if it fits in max_frames; otherwise the shortest loop of
+    whole frames within tolerance, or failing that the closest one.'''
+    period = exact_period(rates)
+    if period is not None and period / ticks_per_frame <= max_frames:
+        frames = max(1, round(period / ticks_per_frame))
+        return frames, float(period), 0.0
+    slowest = min((abs(rate) / symmetry for key, rate, symmetry in rates
+            if rate), default=None)
+    if slowest is None:
+        return 1, ticks_per_frame, 0.0
+    max_frames = max(1, max_frames)
+    # every ring must make at least about one turn; if the slowest ring
+    # cannot within max_frames, only the longest loop is left to try
+    first = max(1, ceil(1 / (slowest * (1 + tolerance)) / ticks_per_frame))
+    first = min(first, max_frames)
+    best = None
+    chunk = max(1, (1 << 20) // max(1, len(rates)))
+    for start in range(first, max_frames + 1, chunk):
+        frame_counts = list(range(start, min(start + chunk, max_frames + 1)))
+        errors = _turn_errors(rates,
+                [frames * ticks_per_frame for frames in frame_counts])
+        for frames, error in zip(frame_counts, errors):
+            if best is None or error < best[2]:
+                best = (frames, frames * ticks_per_frame, float(error))
+            if error <= tolerance:
+                return best
+    if best is None:
+        best = (max_frames, max_frames * ticks_per_frame, 1.0)
+    log.warning("No loop of up to {0} frames keeps speeds within {1:.1%}; "
+            "using {2} frames, changing speeds by up to {3:.1%}.".format(
+                max_frames, tolerance, best[0], best[2]))
+    return best
+
+
+class LoopCache:
+    '''One seamless loop of an orbit's keyframes. fps is the playback rate
+    aimed for; the actual one (self.fps) is adjusted slightly so the loop
+    spans whole frames. Loops are no longer than max_seconds. Caches larger
+    than spill_bytes are kept in a memory-mapped temporary file.'''
+
+    def __init__(self, pw_struct, tick_rate, fps=30, max_seconds=300,
+            tolerance=0.01, spill_bytes=64 * 1024 * 1024):
+        rates = _rates(pw_struct)
+        self.keys = [key for key, rate, symmetry in rates]
+        self.symmetry = [symmetry for key, rate, symmetry in rates]
+        self.signature = self._signature(pw_struct)
+        self.frames, period, self.error = find_loop(rates, tick_rate / fps,
+                int(max_seconds * fps), tolerance)
+        self.period = period / tick_rate # seconds
+        self.fps = self.frames / self.period if self.period else fps
+        # whole symmetry turns per loop, per ring
+        self.turns = [round(period * rate / symmetry) if rate else 0
+                for key, rate, symmetry in rates]
+        self._file = None
+        self._last = None
+        self._store(spill_bytes)
+        log.info("Cached a {0:.1f}s loop of {1} frames for {2} rings "
+                "({3} bytes{4})".format(self.period, self.frames,
+                    len(self.keys), self.nbytes,
+                    ", memory-mapped" if self._file else ""))
+
+    @staticmethod
+    def _signature(pw_struct):
+        master_speed = pw_struct.persistent_state["master_orbit_speed"]
+        return (master_speed, tuple((key, ring.count,
+                tuple(ring.scaler_list), getattr(ring, "radial_speed", 0))
+                for key, ring in pw_struct.ring_array.items()))
+
+    def matches(self, pw_struct):
+        '''True if the struct's rings and speeds are still those the loop
+        was cached for.'''
+        return self._signature(pw_struct) == self.signature
+
+    def _store(self, spill_bytes):
+        rings = len(self.keys)
+        self.nbytes = self.frames * rings * 2
+        if self.nbytes > spill_bytes:
+            self._file = tempfile.TemporaryFile(prefix="pwloop-")
+            self._file.truncate(self.nbytes)
+            self._buffer = mmap.mmap(self._file.fileno(), self.nbytes)
+        else:
+            self._buffer = bytearray(self.nbytes)
+        if not rings:
+            self.keyframes = []
+            return
+        # phase of ring i at frame k: (turns[i] * k mod frames) / frames of
+        # its symmetry angle
+        if pwgeometry.use_numpy:
+            self.keyframes = numpy.frombuffer(self._buffer,
+                    dtype=numpy.uint16).reshape(self.frames, rings)
+            turns = numpy.array(self.turns, dtype=numpy.int64)
+            chunk = max(1, (1 << 20) // rings)
+            for start in range(0, self.frames, chunk):
+                k = numpy.arange(start, min(start + chunk, self.frames),
+                        dtype=numpy.int64)
+                phase = numpy.outer(k, turns) % self.frames
+                self.keyframes[start:start + len(k)] = \
+                        phase * PHASE_STEPS // self.frames
+        else:
+            view = memoryview(self._buffer).cast("H")
+            for k in range(self.frames):
+                for i, turns in enumerate(self.turns):
+                    view[k * rings + i] = \
+                            turns * k % self.frames * PHASE_STEPS // self.frames
+            self.keyframes = [view[k * rings:(k + 1) * rings]
+                    for k in range(self.frames)]
+
+    def rotations(self, frame):
+        '''Orbit rotation (degrees) of each ring at the given frame.'''
+        return [int(phase) * symmetry / PHASE_STEPS for phase, symmetry
+                in zip(self.keyframes[frame % self.frames], self.symmetry)]
+
+    def apply(self, pw_struct, frame):
+        '''Set the orbit rotation of every ring whose keyframe changed since
+        the last frame applied.'''
+        frame %= self.frames
+        row = self.keyframes[frame]
+        if self._last is None:
+            changed = range(len(self.keys))
+        elif pwgeometry.use_numpy:
+            changed = numpy.flatnonzero(row != self.keyframes[self._last])
+        else:
+            last = self.keyframes[self._last]
+            changed = [i for i in range(len(self.keys)) if row[i] != last[i]]
+        ring_array = pw_struct.ring_array
+        for i in changed:
+            ring = ring_array.get(self.keys[i])
+            if ring is not None:
+                ring.set_orbit_rotation(
+                        int(row[i]) * self.symmetry[i] / PHASE_STEPS)
+        self._last = frame
+
+    def close(self):
+        '''Release the keyframes, and the temporary file if they spilled.'''
+        self.keyframes = []
+        if self._file is not None:
+            self._buffer.close()
+            self._file.close()
+            self._file = None
+        self._buffer = None
@@ -0,0 +1,178 @@
+'''Detection of overlapping stickers, within and across rings.
+
+A broad phase bounds each sticker by its polar interval: the band of radii
+radius +/- reach and the angular span angle +/- asin(reach / radius), where
+reach is the distance from the sticker's position to its farthest vertex.
+Only rings whose radius bands meet are paired up, and within a pair of
+rings (or a ring and itself) only stickers whose angular spans meet are
+candidates. Candidates are then checked with a separating axis test, over
+all candidate pairs of two rings at once when numpy is available.
+
+The separating axis test is exact for convex stickers; for concave ones it
+tests their convex hulls, so it may report stickers which only nearly
+touch. Stickers which merely touch along an edge do not count as
+overlapping.
+'''
+from bisect import bisect_left, bisect_right
+from math import asin, degrees
+
+import pwgeometry
+import pwlogging
+from pwgeometry import numpy
+
+# Projections must overlap by more than this to count as overlapping.
+TOLERANCE = 1e-9
+
+
+class _RingBounds:
+    '''A ring's stickers as the broad and narrow phases need them.'''
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.key = str(ring.id)
+        self.radius = ring.radius
+        self.reach = pwgeometry.bounding_radius(ring.baseStickerPoly)
+        self.vertices = ring.displayed_vertices()
+        if self.radius <= self.reach:
+            self.span = 180.0
+        else:
+            self.span = degrees(asin(self.reach / self.radius))
+        angles = pwgeometry.angular_offsets(ring.count, ring.scaler_list,
+                ring.increment)
+        offset = ring.displayed_offset()
+        if pwgeometry.use_numpy:
+            angles = (numpy.asarray(angles) + offset) % 360
+            self.order = numpy.argsort(angles, kind="stable")
+            self.angles = angles[self.order]
+        else:
+            angles = [(angle + offset) % 360 for angle in angles]
+            self.order = sorted(range(len(angles)), key=angles.__getitem__)
+            self.angles = [angles[k] for k in self.order]
+
+    def __len__(self):
+        return len(self.angles)
+
+
+def _angular_candidates(a, b, window):
+    '''Index pairs (into a's and b's stickers) of stickers no more than
+    `window` degrees apart.'''
+    n = len(a)
+    if pwgeometry.use_numpy:
+        extended = numpy.concatenate((a.angles - 360, a.angles,
+            a.angles + 360))
+        extended_order = numpy.tile(a.order, 3)
+        low = numpy.searchsorted(extended, b.angles - window, "left")
+        high = numpy.searchsorted(extended, b.angles + window, "right")
+        high = numpy.minimum(high, low + n)
+        counts = high - low
+        total = int(counts.sum())
+        starts = numpy.repeat(low - (numpy.cumsum(counts) - counts), counts)
+        positions = starts + numpy.arange(total)
+        return (extended_order[positions],
+                numpy.repeat(b.order, counts))
+    extended = [angle - 360 for angle in a.angles] + list(a.angles) + \
+            [angle + 360 for angle in a.angles]
+    pairs_a = []
+    pairs_b = []
+    for k, angle in zip(b.order, b.angles):
+        low = bisect_left(extended, angle - window)
+        high = min(bisect_right(extended, angle + window), low + n)
+        for position in range(low, high):
+            pairs_a.append(a.order[position % n])
+            pairs_b.append(k)
+    return pairs_a, pairs_b
+
+
+def _edge_normals(polygons):
+    edges = numpy.roll(polygons, -1, axis=1) - polygons
+    return numpy.stack((-edges[..., 1], edges[..., 0]), axis=-1)
+
+
+def _separating_axis_overlaps(p, q):
+    '''Boolean array: whether each polygon of p (m, n, 2) overlaps the
+    corresponding polygon of q (m, k, 2).'''
+    axes = numpy.concatenate((_edge_normals(p), _edge_normals(q)), axis=1)
+    p_proj = numpy.einsum("mvd,mad->mva", p, axes)
+    q_proj = numpy.einsum("mvd,mad->mva", q, axes)
+    separated = (p_proj.max(axis=1) <= q_proj.min(axis=1) + TOLERANCE) | \
+            (q_proj.max(axis=1) <= p_proj.min(axis=1) + TOLERANCE)
+    return ~separated.any(axis=1)
+
+
+def polygons_overlap(p, q):
+    '''Separating axis test for a single pair of polygons, given as
+    sequences of (x, y) points.'''
+    for polygon in (p, q):
+        for (x1, y1), (x2, y2) in zip(polygon, polygon[1:] + polygon[:1]):
+            axis = (y1 - y2, x2 - x1)
+            p_proj = [x * axis[0] + y * axis[1] for x, y in p]
+            q_proj = [x * axis[0] + y * axis[1] for x, y in q]
+            if max(p_proj) <= min(q_proj) + TOLERANCE or \
+                    max(q_proj) <= min(p_proj) + TOLERANCE:
+                return False
+    return True
+
+
+def _pair_overlaps(a, b):
+    '''Overlapping (a sticker, b sticker) index pairs of two rings; when a
+    is b, each pair is reported once.'''
+    if not len(a) or not len(b):
+        return []
+    if abs(a.radius - b.radius) > a.reach + b.reach:
+        return []
+    ka, kb = _angular_candidates(a, b, a.span + b.span)
+    if pwgeometry.use_numpy:
+        if a is b:
+            keep = ka < kb
+            ka, kb = ka[keep], kb[keep]
+        if not len(ka):
+            return []
+        vertices_a = numpy.asarray(a.vertices)
+        vertices_b = numpy.asarray(b.vertices)
+        hits = _separating_axis_overlaps(vertices_a[ka], vertices_b[kb])
+        return list(zip(ka[hits].tolist(), kb[hits].tolist()))
+    found = []
+    for i, j in zip(ka, kb):
+        if a is b and i >= j:
+            continue
+        if polygons_overlap([tuple(p) for p in a.vertices[i]],
+                [tuple(p) for p in b.vertices[j]]):
+            found.append((i, j))
+    return found
+
+
+def _overlaps_between(a, others):
+    '''Overlapping pairs between ring bounds a and each of others.'''
+    found = []
+    for b in others:
+        for i, j in _pair_overlaps(a, b):
+            found.append(((a.key, i), (b.key, j)))
+    return found
+
+
+def find_overlaps(ring_array):
+    '''Every overlapping pair of stickers in a RingRegistry, as a list of
+    ((ring key, sticker index), (ring key, sticker index)) tuples.'''
+    bounds = [_RingBounds(ring) for ring in ring_array.by_radius()]
+    radii = [b.radius for b in bounds]
+    max_reach = max((b.reach for b in bounds), default=0.0)
+    found = []
+    for i, a in enumerate(bounds):
+        end = bisect_right(radii, a.radius + a.reach + max_reach)
+        found.extend(_overlaps_between(a, bounds[i:end]))
+    pwlogging.trace("Found overlapping sticker pairs", pairs=len(found),
+            rings=len(bounds))
+    return found
+
+
+def overlaps_with(ring, ring_array):
+    '''The overlapping pairs involving one ring, for rechecking just the
+    ring that changed. Pairs are ordered with the given ring first.'''
+    a = _RingBounds(ring)
+    reach = a.reach + ring_array.max_sticker_reach
+    others = [_RingBounds(other) if other is not ring else a
+            for other in ring_array.in_radius_range(a.radius - reach,
+                a.radius + reach)]
+    if a not in others:
+        others.append(a)
+    return _overlaps_between(a, others)
@@ -0,0 +1,230 @@
+from bisect import bisect_left
+import logging as log
+from math import atan2, hypot, pi
+
+# Plotter units per canvas unit for HPGL output (HP-GL uses 0.025mm/unit;
+# 40 units is one millimetre per canvas unit).
+HPGL_UNITS = 40
+
+
+class PlotJob:
+    '''An ordered list of closed sticker outlines to plot, with the pen
+    travel needed to go from one to the next. Each path is a list of (x, y)
+    points in canvas units; the pen draws it and returns to its start.'''
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    def draw_distance(self):
+        '''Total pen-down distance.'''
+        total = 0.0
+        for path in self.paths:
+            for (x1, y1), (x2, y2) in zip(path, path[1:] + path[:1]):
+                total += hypot(x2 - x1, y2 - y1)
+        return total
+
+    def travel_distance(self, origin=(0.0, 0.0)):
+        '''Total pen-up distance, starting from `origin` and returning to it.
+        Each sticker is entered and left at its first point.'''
+        total = 0.0
+        x, y = origin
+        for path in self.paths:
+            total += hypot(path[0][0] - x, path[0][1] - y)
+            x, y = path[0]
+        if self.paths:
+            total += hypot(origin[0] - x, origin[1] - y)
+        return total
+
+    def report(self):
+        return {"stickers": len(self.paths),
+                "draw_distance": self.draw_distance(),
+                "travel_distance": self.travel_distance()}
+
+
+def _angle(point):
+    '''Angle of a point about the origin, in radians, in the same sense as
+    StickerRing offsets (zero along the positive Y axis).'''
+    return atan2(-point[0], point[1])
+
+
+def _distance(a, b):
+    return hypot(a[0] - b[0], a[1] - b[1])
+
+
+def _relative_angles(points):
+    '''Angle of each point relative to the first, in [0, 2pi).'''
+    first = _angle(points[0])
+    return [(_angle(point) - first) % (2 * pi) for point in points]
+
+
+def nearest_neighbour_order(points, start=0):
+    '''Return an ordering of a ring's sticker points which visits the
+    nearest unvisited point at each step, beginning at index `start`.
+
+    The points all lie on one circle about the origin, in increasing angle
+    (as StickerRing lays them out), so the nearest unvisited point is always
+    the next unvisited one on either side; only those two are compared.'''
+    n = len(points)
+    remaining = list(range(n))
+    remaining.remove(start)
+    order = [start]
+    current = start
+    while remaining:
+        position = bisect_left(remaining, current)
+        after = remaining[position % len(remaining)]
+        before = remaining[position - 1]
+        if _distance(points[current], points[before]) < \
+                _distance(points[current], points[after]):
+            current = before
+        else:
+            current = after
+        remaining.remove(current)
+        order.append(current)
+    return order
+
+
+def two_opt(points, order, max_passes=8, window=32):
+    '''Improve an open path (fixed first point) by 2-opt: reverse any
+    segment whose reversal shortens the path, until no improvement is found
+    or max_passes is reached. Only segments up to `window` points long are
+    considered; stickers on a ring have no useful long-range swaps, and
+    this keeps each pass linear in the number of stickers.'''
+    order = list(order)
+    n = len(order)
+    for improvement_pass in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            a, b = points[order[i - 1]], points[order[i]]
+            for j in range(i + 1, min(n, i + window)):
+                c = points[order[j]]
+                d = points[order[j + 1]] if j + 1 < n else None
+                before = _distance(a, b) + (_distance(c, d) if d else 0)
+                after = _distance(a, c) + (_distance(b, d) if d else 0)
+                if after < before - 1e-9:
+                    order[i:j + 1] = reversed(order[i:j + 1])
+                    b = points[order[i]]
+                    improved = True
+        if not improved:
+            break
+    return order
+
+
+def plan(pw_struct, optimize=True):
+    '''Order every sticker of a composition for plotting and return a
+    PlotJob.
+
+    Rings are visited greedily: from the pen's current position, the next
+    ring is the unvisited one with a sticker nearest the pen, where each
+    ring's candidate sticker is found by angular proximity to the pen.
+    Within a ring, stickers are ordered by nearest neighbour from that entry
+    sticker, followed by a 2-opt pass.
+    With optimize=False, stickers are plotted in ring/sticker order.'''
+    rings = [ring for ring in pw_struct.ring_array.values() if ring.count]
+    ring_points = {}
+    ring_angles = {}
+    ring_paths = {}
+    for ring in rings:
+        paths = [list(map(tuple, sticker)) for sticker in
+                ring.displayed_vertices()]
+        ring_paths[ring.id] = paths
+        ring_points[ring.id] = [path[0] for path in paths]
+        ring_angles[ring.id] = _relative_angles(ring_points[ring.id])
+    if not optimize:
+        return PlotJob([path for ring in rings for path in ring_paths[ring.id]])
+    ordered = []
+    pen = (0.0, 0.0)
+    remaining = set(ring_paths)
+    while remaining:
+        best = None
+        for ring_id in remaining:
+            entry = _closest_on_ring(ring_points[ring_id],
+                    ring_angles[ring_id], pen)
+            distance = _distance(pen, ring_points[ring_id][entry])
+            if best is None or distance < best[0]:
+                best = (distance, ring_id, entry)
+        distance, ring_id, entry = best
+        remaining.remove(ring_id)
+        points = ring_points[ring_id]
+        order = two_opt(points, nearest_neighbour_order(points, entry))
+        ordered.extend(ring_paths[ring_id][i] for i in order)
+        pen = points[order[-1]]
+    job = PlotJob(ordered)
+    log.debug("Planned plot of {0} stickers: {1}".format(len(ordered),
+        job.report()))
+    return job
+
+
+def _closest_on_ring(points, angles, pen):
+    '''Index of the ring's sticker point closest to the pen: the points lie
+    on a circle in angular order, so this is whichever of the two points
+    angularly either side of the pen is nearer.'''
+    if hypot(*pen) < 1e-9:
+        return 0
+    target = (_angle(pen) - _angle(points[0])) % (2 * pi)
+    position = bisect_left(angles, target)
+    candidates = (position % len(points), position - 1)
+    return min(candidates, key=lambda i: _distance(pen, points[i]))
+
+
+def write_hpgl(job, file, units=HPGL_UNITS):
+    '''Write a PlotJob as HP-GL. Canvas Y points down, plotter Y points up,
+    so Y is inverted.'''
+    def xy(point):
+        return "{0},{1}".format(round(point[0] * units),
+                round(-point[1] * units))
+    file.write("IN;SP1;\n")
+    for path in job.paths:
+        file.write("PU{0};\n".format(xy(path[0])))
+        file.write("PD{0};\n".format(",".join(
+            xy(point) for point in path[1:] + path[:1])))
+    file.write("PU0,0;SP0;\n")
+
+
+def write_gcode(job, file, feed_rate=3000, travel_rate=6000, pen_up="M5",
+        pen_down="M3", scale=1.0):
+    '''Write a PlotJob as G-code in millimetres, one canvas unit to `scale`
+    mm. The pen is raised and lowered with the pen_up/pen_down commands
+    (spindle off/on by default, as used by most servo pen plotters).'''
+    def xy(point):
+        return "X{0:.3f} Y{1:.3f}".format(point[0] * scale,
+                -point[1] * scale)
+    file.write("G21\nG90\n{0}\n".format(pen_up))
+    for path in job.paths:
+        file.write("G0 {0} F{1}\n{2}\n".format(xy(path[0]), travel_rate,
+            pen_down))
+        for point in path[1:] + path[:1]:
+            file.write("G1 {0} F{1}\n".format(xy(point), feed_rate))
+        file.write("{0}\n".format(pen_up))
+    file.write("G0 X0 Y0\n")
+
+
+FORMATS = {
+    ".hpgl": write_hpgl,
+    ".plt": write_hpgl,
+    ".gcode": write_gcode,
+    ".nc": write_gcode,
+    }
+
+
+def write_instructions(pw_struct, output_file, format=None, optimize=True,
+        **kwargs):
+    '''Plan and write plotter instructions for a composition. The format is
+    chosen from the extension unless given ('.hpgl'/'.plt' for HP-GL,
+    '.gcode'/'.nc' for G-code). Returns the PlotJob's report (sticker count
+    and draw/travel distances in canvas units).'''
+    if format is None:
+        format = "." + output_file.rsplit(".", 1)[-1].lower()
+    elif not format.startswith("."):
+        format = "." + format
+    try:
+        writer = FORMATS[format]
+    except KeyError:
+        raise ValueError("Unknown plotter format: {0}".format(format))
+    job = plan(pw_struct, optimize=optimize)
+    with open(output_file, "w") as file:
+        writer(job, file, **kwargs)
+    report = job.report()
+    log.info("Wrote plot of {stickers} stickers: draw distance "
+            "{draw_distance:.1f}, travel distance {travel_distance:.1f}".format(
+                **report))
+    return report
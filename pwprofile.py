@@ -0,0 +1,240 @@
+'''Profiling: per-subsystem timers, and whole-program profiling sessions.
+
+Subsystem timers are cheap enough to leave in place permanently:
+
+    _geometry_timer = pwprofile.timer("geometry")
+    ...
+    with _geometry_timer:
+        compute()
+
+Every timer keeps a count, a total and the last duration (for a live
+display, for instance). While a ProfileSession is running, each timed span
+is also recorded so it can be exported. A session can additionally run the
+whole program under cProfile, or under a sampling profiler which records
+the main thread's stack every few milliseconds from a background thread.
+
+ProfileSession.export() writes Chrome's trace event format, which both
+chrome://tracing (or Perfetto) and speedscope open: subsystem spans appear
+on the thread that ran them, and sampled stacks as a flame chart on a
+thread of their own.
+'''
+import functools
+import json
+import logging as log
+import os
+import sys
+import threading
+from time import perf_counter, sleep
+
+MODES = ("cprofile", "sample")
+
+# name -> SubsystemTimer
+timers = {}
+
+# The running ProfileSession, if any. Timers record spans into it.
+_session = None
+
+
+class SubsystemTimer:
+    '''Times a subsystem, as a context manager or via timed().'''
+
+    __slots__ = ("name", "count", "total", "last", "_starts")
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self._starts = []
+
+    def __enter__(self):
+        self._starts.append(perf_counter())
+        return self
+
+    def __exit__(self, *exc_info):
+        end = perf_counter()
+        start = self._starts.pop()
+        elapsed = end - start
+        self.count += 1
+        self.total += elapsed
+        self.last = elapsed
+        if _session is not None:
+            _session.spans.append((self.name, start, elapsed,
+                threading.get_ident()))
+
+
+def timer(name):
+    '''The SubsystemTimer of the given name, created on first use.'''
+    subsystem_timer = timers.get(name)
+    if subsystem_timer is None:
+        subsystem_timer = timers[name] = SubsystemTimer(name)
+    return subsystem_timer
+
+
+def timed(name):
+    '''Decorator timing every call of a function with timer(name).'''
+    subsystem_timer = timer(name)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with subsystem_timer:
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _Sampler(threading.Thread):
+    '''Records a thread's stack every `interval` seconds.'''
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="pwprofile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = []
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            now = perf_counter()
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append((now, tuple(stack)))
+            sleep(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def _frame_name(code):
+    return "{0} ({1}:{2})".format(code.co_name,
+            os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+class ProfileSession:
+    '''Records subsystem spans between start() and stop(), optionally
+    profiling the program with cProfile (mode "cprofile") or the sampling
+    profiler (mode "sample"; interval in seconds).'''
+
+    def __init__(self, mode=None, interval=0.005):
+        if mode is not None and mode not in MODES:
+            raise ValueError("Unknown profiling mode: {0}".format(mode))
+        self.mode = mode
+        self.interval = interval
+        self.spans = []
+        self.samples = []
+        self.profile = None
+        self._sampler = None
+        self._start_time = None
+
+    def start(self):
+        global _session
+        if _session is not None:
+            raise RuntimeError("A profiling session is already running.")
+        self._start_time = perf_counter()
+        _session = self
+        if self.mode == "cprofile":
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif self.mode == "sample":
+            self._sampler = _Sampler(threading.get_ident(), self.interval)
+            self._sampler.start()
+        log.info("Profiling started{0}.".format(
+            " with " + self.mode if self.mode else ""))
+        return self
+
+    def stop(self):
+        global _session
+        if self.profile is not None:
+            self.profile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+            self.samples = self._sampler.samples
+            self._sampler = None
+        if _session is self:
+            _session = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def summary(self):
+        '''Per-subsystem count, total and mean seconds for the session.'''
+        totals = {}
+        for name, start, elapsed, thread_id in self.spans:
+            count, total = totals.get(name, (0, 0.0))
+            totals[name] = (count + 1, total + elapsed)
+        return {name: {"count": count, "total": total,
+                "mean": total / count}
+                for name, (count, total) in totals.items()}
+
+    def report(self, file=None, limit=25):
+        '''Print the subsystem summary, and the top of the cProfile stats
+        when profiling with cProfile.'''
+        file = file or sys.stderr
+        print("{0:<20}{1:>10}{2:>12}{3:>12}".format("subsystem", "calls",
+            "total ms", "mean ms"), file=file)
+        for name, stats in sorted(self.summary().items()):
+            print("{0:<20}{1:>10}{2:>12.2f}{3:>12.3f}".format(name,
+                stats["count"], stats["total"] * 1000,
+                stats["mean"] * 1000), file=file)
+        if self.profile is not None:
+            import io
+            import pstats
+            output = io.StringIO()
+            pstats.Stats(self.profile, stream=output).sort_stats(
+                    "cumulative").print_stats(limit)
+            print(output.getvalue(), file=file)
+
+    def trace_events(self):
+        '''The session as a list of Chrome trace events.'''
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid,
+            "args": {"name": "Panawave Umbrella"}}]
+        def to_us(t):
+            return (t - self._start_time) * 1e6
+        for name, start, elapsed, thread_id in self.spans:
+            events.append({"name": name, "cat": "subsystem", "ph": "X",
+                "ts": to_us(start), "dur": elapsed * 1e6, "pid": pid,
+                "tid": thread_id})
+        if self.samples:
+            # Sampled stacks become nested spans on a thread of their own:
+            # a frame's span lasts as long as consecutive samples include
+            # it at the same depth.
+            tid = 0
+            events.append({"name": "thread_name", "ph": "M", "pid": pid,
+                "tid": tid, "args": {"name": "sampled stacks"}})
+            open_frames = []
+            end = self.samples[-1][0] + self.interval
+            for now, stack in self.samples + [(end, ())]:
+                depth = 0
+                while depth < min(len(open_frames), len(stack)) and \
+                        open_frames[depth][0] is stack[depth]:
+                    depth += 1
+                for code, start in reversed(open_frames[depth:]):
+                    events.append({"name": _frame_name(code),
+                        "cat": "sample", "ph": "X", "ts": to_us(start),
+                        "dur": (now - start) * 1e6, "pid": pid, "tid": tid})
+                del open_frames[depth:]
+                open_frames.extend((code, now) for code in stack[depth:])
+        return events
+
+    def export(self, path):
+        '''Write the session as a Chrome trace JSON file, and with cProfile
+        also the raw stats beside it (as <path without extension>.prof, for
+        pstats or snakeviz).'''
+        with open(path, "w") as file:
+            json.dump({"traceEvents": self.trace_events(),
+                "displayTimeUnit": "ms"}, file)
+        if self.profile is not None:
+            self.profile.dump_stats(os.path.splitext(path)[0] + ".prof")
+        log.info("Wrote profile of {0} spans and {1} samples to {2}".format(
+            len(self.spans), len(self.samples), path))
@@ -0,0 +1,232 @@
+import logging as log
+from math import ceil
+import struct
+import zlib
+
+import pwgeometry
+from pwgeometry import numpy
+from radialstructs import PanawaveStruct
+
+# The editor canvas is 600x600 with its origin at the center; renders are
+# scaled relative to this by default so they match what's shown on screen.
+CANVAS_SIZE = 600
+
+# Upper bound on the number of edge intersections computed in one numpy
+# batch, to keep memory bounded for very large rings.
+BATCH_LIMIT = 1 << 22
+
+
+def parse_color(color):
+    '''Accept an (r, g, b) tuple or a tk-style '#rrggbb' string.'''
+    if isinstance(color, str):
+        color = color.lstrip("#")
+        return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+    return tuple(int(c) for c in color)
+
+
+class Raster:
+    '''An 8-bit RGB image. pixels is a (height, width, 3) uint8 array when
+    numpy is available, otherwise a flat bytearray of RGB triples.'''
+
+    def __init__(self, width, height, pixels):
+        self.width = width
+        self.height = height
+        self.pixels = pixels
+
+    def row_bytes(self):
+        '''Yield each row of the image as RGB bytes.'''
+        if numpy is not None and isinstance(self.pixels, numpy.ndarray):
+            for row in self.pixels:
+                yield row.tobytes()
+        else:
+            stride = self.width * 3
+            for y in range(self.height):
+                yield bytes(self.pixels[y * stride:(y + 1) * stride])
+
+    def write_png(self, output_file):
+        '''Write the image as a PNG file (truecolor, no interlacing).'''
+        def chunk(tag, data):
+            return (struct.pack(">I", len(data)) + tag + data +
+                    struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+        compressor = zlib.compressobj(6)
+        data = bytearray()
+        for row in self.row_bytes():
+            # every scanline is prefixed with its filter type; 0 is 'None'
+            data += compressor.compress(b"\x00" + row)
+        data += compressor.flush()
+        with open(output_file, "wb") as file:
+            file.write(b"\x89PNG\r\n\x1a\n")
+            file.write(chunk(b"IHDR", struct.pack(">IIBBBBB",
+                self.width, self.height, 8, 2, 0, 0, 0)))
+            file.write(chunk(b"IDAT", bytes(data)))
+            file.write(chunk(b"IEND", b""))
+
+
+class ScanlineRasterizer:
+    '''Fills polygons into a coverage mask using scanline conversion. A pixel
+    is covered when its center falls inside a polygon, using the even-odd
+    rule per polygon; overlapping polygons simply merge. Spans are
+    accumulated as +1/-1 marks in a difference buffer and resolved with one
+    running sum per row at the end, so each polygon costs a handful of
+    writes per scanline regardless of its width.'''
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        if pwgeometry.use_numpy:
+            self._diff = numpy.zeros((height, width + 1), dtype=numpy.int32)
+        else:
+            self._diff = [[0] * (width + 1) for row in range(height)]
+
+    def fill_polygons(self, polygons):
+        '''Fill a batch of polygons given in pixel coordinates, either as a
+        (count, n_vertices, 2) array or as a list of point lists.'''
+        if len(polygons) == 0:
+            return
+        if pwgeometry.use_numpy:
+            polygons = numpy.asarray(polygons, dtype=float)
+            n_vertices = polygons.shape[1]
+            heights = numpy.ptp(polygons[:, :, 1], axis=1)
+            rows = int(heights.max()) + 2
+            batch = max(1, BATCH_LIMIT // (rows * n_vertices))
+            for start in range(0, len(polygons), batch):
+                self._fill_numpy(polygons[start:start + batch], rows)
+        else:
+            for polygon in polygons:
+                self._fill_python(polygon)
+
+    def _fill_numpy(self, polygons, rows):
+        x1 = polygons[:, :, 0]
+        y1 = polygons[:, :, 1]
+        x2 = numpy.roll(x1, -1, axis=1)
+        y2 = numpy.roll(y1, -1, axis=1)
+        first_row = numpy.ceil(y1.min(axis=1) - 0.5).astype(int)
+        # row index and pixel-center y of every candidate scanline:
+        # shape (polygons, rows)
+        row_index = first_row[:, None] + numpy.arange(rows)[None, :]
+        yc = (row_index + 0.5)[:, :, None]
+        # edge crossings, with a half-open rule so shared vertices count once
+        crosses = (y1[:, None, :] <= yc) != (y2[:, None, :] <= yc)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            xs = x1[:, None, :] + (yc - y1[:, None, :]) * \
+                    (x2 - x1)[:, None, :] / (y2 - y1)[:, None, :]
+        xs = numpy.where(crosses, xs, numpy.inf)
+        xs.sort(axis=2)
+        starts = xs[:, :, 0::2]
+        ends = xs[:, :, 1::2]
+        if ends.shape[2] < starts.shape[2]:
+            starts = starts[:, :, :ends.shape[2]]
+        valid = numpy.isfinite(ends) & \
+                (row_index[:, :, None] >= 0) & \
+                (row_index[:, :, None] < self.height)
+        valid = numpy.broadcast_to(valid, starts.shape)
+        span_rows = numpy.broadcast_to(row_index[:, :, None], starts.shape)[valid]
+        col_start = numpy.clip(numpy.ceil(starts[valid] - 0.5), 0, self.width)
+        col_end = numpy.clip(numpy.ceil(ends[valid] - 0.5), 0, self.width)
+        keep = col_end > col_start
+        span_rows = span_rows[keep]
+        numpy.add.at(self._diff, (span_rows, col_start[keep].astype(int)), 1)
+        numpy.add.at(self._diff, (span_rows, col_end[keep].astype(int)), -1)
+
+    def _fill_python(self, polygon):
+        edges = list(zip(polygon, polygon[1:] + polygon[:1]))
+        ys = [p[1] for p in polygon]
+        first_row = max(0, ceil(min(ys) - 0.5))
+        last_row = min(self.height, ceil(max(ys) - 0.5))
+        for row in range(first_row, last_row):
+            yc = row + 0.5
+            xs = sorted(x1 + (yc - y1) * (x2 - x1) / (y2 - y1)
+                    for (x1, y1), (x2, y2) in edges
+                    if (y1 <= yc) != (y2 <= yc))
+            diff_row = self._diff[row]
+            for xa, xb in zip(xs[0::2], xs[1::2]):
+                col_start = min(self.width, max(0, ceil(xa - 0.5)))
+                col_end = min(self.width, max(0, ceil(xb - 0.5)))
+                if col_end > col_start:
+                    diff_row[col_start] += 1
+                    diff_row[col_end] -= 1
+
+    def coverage(self):
+        '''Return the covered pixels: a boolean (height, width) array, or a
+        list of rows of 0/1 values without numpy.'''
+        if pwgeometry.use_numpy:
+            return numpy.cumsum(self._diff, axis=1)[:, :self.width] > 0
+        mask = []
+        for diff_row in self._diff:
+            running = 0
+            row = []
+            for d in diff_row[:self.width]:
+                running += d
+                row.append(1 if running > 0 else 0)
+            mask.append(row)
+        return mask
+
+
+def render_struct(pw_struct, width=CANVAS_SIZE, height=None, scale=None,
+        supersample=1, background="#ffffff", fill="#000000"):
+    '''Rasterize a PanawaveStruct without Tk, returning a Raster.
+
+    The composition's origin is placed at the image center. By default it is
+    scaled so that the editor's 600x600 canvas fills the image; pass `scale`
+    for a specific number of pixels per canvas unit. `supersample` renders at
+    that many times the resolution in each direction and averages the result
+    down, anti-aliasing the sticker edges.'''
+    if height is None:
+        height = width
+    if scale is None:
+        scale = min(width, height) / CANVAS_SIZE
+    ss = max(1, int(supersample))
+    rasterizer = ScanlineRasterizer(width * ss, height * ss)
+    pixel_scale = scale * ss
+    cx, cy = width * ss / 2, height * ss / 2
+    for ring in pw_struct.ring_array.values():
+        vertices = ring.displayed_vertices()
+        if pwgeometry.use_numpy:
+            polygons = numpy.asarray(vertices, dtype=float) * pixel_scale
+            polygons[:, :, 0] += cx
+            polygons[:, :, 1] += cy
+        else:
+            polygons = [[(x * pixel_scale + cx, y * pixel_scale + cy)
+                        for x, y in sticker] for sticker in vertices]
+        rasterizer.fill_polygons(polygons)
+    log.debug("Rasterized {0} rings at {1}x{2} (supersample {3})".format(
+        len(pw_struct.ring_array), width, height, ss))
+    return _compose(rasterizer.coverage(), width, height, ss,
+            parse_color(background), parse_color(fill))
+
+
+def _compose(mask, width, height, ss, background, fill):
+    '''Reduce a supersampled coverage mask to pixel intensities and blend the
+    fill color over the background.'''
+    if pwgeometry.use_numpy:
+        coverage = mask.reshape(height, ss, width, ss).mean(axis=(1, 3))
+        bg = numpy.array(background, dtype=float)
+        fg = numpy.array(fill, dtype=float)
+        pixels = bg + (fg - bg) * coverage[:, :, None]
+        return Raster(width, height,
+                numpy.rint(pixels).astype(numpy.uint8))
+    samples = ss * ss
+    pixels = bytearray()
+    for y in range(height):
+        rows = mask[y * ss:(y + 1) * ss]
+        for x in range(width):
+            covered = sum(sum(row[x * ss:(x + 1) * ss]) for row in rows)
+            alpha = covered / samples
+            pixels.extend(round(b + (f - b) * alpha)
+                    for b, f in zip(background, fill))
+    return Raster(width, height, pixels)
+
+
+def render_to_png(pw_struct, output_file, **kwargs):
+    '''Render a PanawaveStruct straight to a PNG file. Keyword arguments are
+    passed to render_struct.'''
+    raster = render_struct(pw_struct, **kwargs)
+    raster.write_png(output_file)
+    return raster
+
+
+def render_file_to_png(input_file, output_file, **kwargs):
+    '''Load a saved composition and render it to a PNG file.'''
+    pw_struct = PanawaveStruct()
+    pw_struct.load_from_file(input_file)
+    return render_to_png(pw_struct, output_file, **kwargs)
@@ -0,0 +1,106 @@
+import logging as log
+
+import pwgeometry
+
+# Default view matches the editor's 600x600 canvas, origin at the center.
+CANVAS_SIZE = 600
+
+# Number of <use> elements formatted per write when streaming a ring.
+CHUNK_SIZE = 1024
+
+
+def _num(value):
+    '''Compact number formatting for SVG attributes.'''
+    return "{0:.6g}".format(value)
+
+
+def write_svg(pw_struct, output_file, width=CANVAS_SIZE, height=None,
+        view_size=CANVAS_SIZE, fill="#000000", background=None):
+    '''Write a PanawaveStruct to an SVG file, streaming it ring by ring.
+
+    Rather than writing out every vertex, each ring's base sticker is
+    defined once as a <symbol> (centered on the origin) and every sticker is
+    placed with <use transform="rotate(angle) translate(0 radius)">, the same
+    construction StickerRing uses to compute its geometry. `width` and
+    `height` set the document's size; `view_size` is the span of canvas
+    units shown, centered on the origin.'''
+    if height is None:
+        height = width
+    half = view_size / 2
+    with open(output_file, "w") as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        file.write('<svg xmlns="http://www.w3.org/2000/svg" '
+                'xmlns:xlink="http://www.w3.org/1999/xlink" '
+                'width="{0}" height="{1}" viewBox="{2} {2} {3} {3}">\n'.format(
+                    _num(width), _num(height), _num(-half), _num(view_size)))
+        if background is not None:
+            file.write('<rect x="{0}" y="{0}" width="{1}" height="{1}" '
+                    'fill="{2}"/>\n'.format(
+                        _num(-half), _num(view_size), background))
+        for ring in pw_struct.ring_array.values():
+            _write_ring(file, ring, fill)
+        file.write('</svg>\n')
+    log.debug("Wrote {0} rings to SVG file {1}".format(
+        len(pw_struct.ring_array), output_file))
+
+
+def _write_ring(file, ring, fill):
+    symbol_id = "sticker-{0}".format(ring.id)
+    points = " ".join("{0},{1}".format(_num(x), _num(y))
+            for x, y in pwgeometry.centered_base(ring.baseStickerPoly))
+    file.write('<symbol id="{0}" overflow="visible">'
+            '<polygon points="{1}"/></symbol>\n'.format(symbol_id, points))
+    file.write('<g id="ring-{0}" fill="{1}">\n'.format(ring.id, fill))
+    offset = ring.displayed_offset()
+    use = '<use xlink:href="#{0}" transform="rotate({{0}}) translate(0 {1})"/>\n'.format(
+            symbol_id, _num(ring.radius))
+    angles = pwgeometry.angular_offsets(ring.count, ring.scaler_list,
+            ring.increment)
+    for start in range(0, ring.count, CHUNK_SIZE):
+        file.write("".join(use.format(_num((offset + angle) % 360))
+            for angle in angles[start:start + CHUNK_SIZE]))
+    file.write('</g>\n')
+
+
+def write_postscript(pw_struct, output_file, width=CANVAS_SIZE, height=None,
+        view_size=CANVAS_SIZE, fill="#000000"):
+    '''Write a PanawaveStruct to an Encapsulated PostScript file, streaming
+    it ring by ring. As with write_svg, each ring's base sticker is defined
+    once (as a procedure) and every sticker is placed by rotating and
+    translating it. `width` and `height` are the page size in points.'''
+    if height is None:
+        height = width
+    scale = min(width, height) / view_size
+    red, green, blue = (int(fill.lstrip("#")[i:i + 2], 16) / 255
+            for i in (0, 2, 4))
+    with open(output_file, "w") as file:
+        file.write("%!PS-Adobe-3.0 EPSF-3.0\n")
+        file.write("%%BoundingBox: 0 0 {0} {1}\n".format(
+            int(round(width)), int(round(height))))
+        file.write("%%EndComments\n")
+        # origin at the page center, Y pointing down as on the canvas
+        file.write("{0} {1} translate {2} {3} scale\n".format(
+            _num(width / 2), _num(height / 2), _num(scale), _num(-scale)))
+        file.write("{0} {1} {2} setrgbcolor\n".format(
+            _num(red), _num(green), _num(blue)))
+        for ring in pw_struct.ring_array.values():
+            _write_ring_postscript(file, ring)
+        file.write("showpage\n%%EOF\n")
+    log.debug("Wrote {0} rings to PostScript file {1}".format(
+        len(pw_struct.ring_array), output_file))
+
+
+def _write_ring_postscript(file, ring):
+    proc = "sticker{0}".format(ring.id)
+    points = pwgeometry.centered_base(ring.baseStickerPoly)
+    path = " ".join("{0} {1} {2}".format(_num(x), _num(y),
+        "moveto" if i == 0 else "lineto") for i, (x, y) in enumerate(points))
+    file.write("/{0} {{ gsave rotate 0 exch translate newpath {1} "
+            "closepath fill grestore }} bind def\n".format(proc, path))
+    offset = ring.displayed_offset()
+    place = "{0} {{0}} {1}\n".format(_num(ring.radius), proc)
+    angles = pwgeometry.angular_offsets(ring.count, ring.scaler_list,
+            ring.increment)
+    for start in range(0, ring.count, CHUNK_SIZE):
+        file.write("".join(place.format(_num((offset + angle) % 360))
+            for angle in angles[start:start + CHUNK_SIZE]))
@@ -1,13 +1,19 @@
 import logging as log
 import tkinter
 # tkinter constants that are easier to ref in the base namespace
-from tkinter import N,E,S,W, VERTICAL, HORIZONTAL, END, CURRENT, DISABLED, NORMAL
+from tkinter import N,E,S,W, VERTICAL, HORIZONTAL, END, DISABLED, NORMAL
 from tkinter.filedialog import askopenfilename, asksaveasfilename
 from tkinter.ttk import Treeview
 from tkinter import ttk
+from bisect import bisect_left, insort
+from collections import OrderedDict
 import sys
 from time import sleep
 
+import pwgeometry
+import pwhittest
+import pwlogging
+import pwprofile
 import radialstructs
 
 class PWWidget:
@@ -20,6 +26,70 @@ tkinter widgets as well as a container for app state data.
     pwapp = None # this needs to be set when the app is instantiated.
 
 
+class PWRedrawScheduler:
+    '''Coalesces model updates and view rebuilds into one pass per Tk idle
+    cycle. A ttk.Scale fires its command for every motion event; rather
+    than applying each value and redrawing synchronously, callers record
+    the latest value for a key with set_value() and mark views dirty with
+    invalidate(). The first request in a cycle schedules flush() with
+    `schedule_idle` (normally after_idle); intermediate values for the same
+    key are dropped, so each flush applies at most one update per key and
+    rebuilds each dirty view once.'''
+
+    def __init__(self, schedule_idle):
+        self._schedule_idle = schedule_idle
+        self._views = OrderedDict()
+        self._pending = OrderedDict()
+        self._dirty = set()
+        self._scheduled = False
+        self.dropped = 0 # count of superseded values, for diagnostics
+        self.flushes = 0
+
+    def register_view(self, name, rebuild):
+        '''Register a rebuild callable under a name for invalidate(). Views
+        are rebuilt in registration order.'''
+        self._views[name] = rebuild
+
+    def set_value(self, key, apply, value):
+        '''Record that apply(value) should run at the next flush, replacing
+        any value still pending for the same key.'''
+        if key in self._pending:
+            self.dropped += 1
+            del self._pending[key] # re-insert so updates apply in order
+        self._pending[key] = (apply, value)
+        self._schedule()
+
+    def invalidate(self, *names):
+        '''Mark the named views (all views if none are given) dirty.'''
+        self._dirty.update(names or self._views)
+        self._schedule()
+
+    def _schedule(self):
+        if not self._scheduled:
+            self._scheduled = True
+            self._schedule_idle(self.flush)
+
+    def flush(self):
+        '''Apply pending values, then rebuild dirty views. Safe to call
+        directly when a caller needs the views up to date immediately.
+
+        Applying values emits change events which invalidate views; those
+        are picked up by this same flush rather than scheduling another.'''
+        self._scheduled = True # don't schedule again while applying
+        pending, self._pending = self._pending, OrderedDict()
+        for apply, value in pending.values():
+            apply(value)
+        dirty, self._dirty = self._dirty, set()
+        self._scheduled = False
+        for name, rebuild in self._views.items():
+            if name in dirty:
+                rebuild()
+        if pending or dirty:
+            self.flushes += 1
+        if self._pending or self._dirty:
+            self._schedule()
+
+
 class PWMenuBar(PWWidget, tkinter.Menu):
     def __init__(self, *args, **kwargs):
         tkinter.Menu.__init__(self, self.pwapp.master)
@@ -59,12 +129,56 @@ class PWViewer(PWWidget):
         # have one yet when this is initted.... the order of intialization should
         # flipped to fix this but for now just gonna do it the lazy way.
         # self.working_struct = self.pwapp.working_struct
-        pass
+        # key -> (ring, removed) for rings changed since the canvas and list
+        # were last brought up to date; None means rebuild everything.
+        self._canvas_changes = None
+        self._list_changes = None
+        # key -> ring for every ring with items on the canvas, so a full
+        # rebuild can delete the items of rings removed in the meantime.
+        self._drawn = {}
+        # Canvas items of the drawn rings, for the HUD.
+        self.item_count = 0
+        # Overlapping sticker pairs, as found by pwoverlap, while
+        # highlight_overlaps is on.
+        self.highlight_overlaps = False
+        self._overlaps = set()
+
+    def attach(self, pw_struct):
+        '''Subscribe to a (newly loaded) struct's changes and schedule a full
+        rebuild. Called by PanawaveApp.load_new_struct.'''
+        for kind in (radialstructs.RING_ADDED,
+                radialstructs.RING_GEOMETRY_CHANGED,
+                radialstructs.RING_SELECTION_CHANGED):
+            pw_struct.subscribe(kind, self._ring_changed)
+        pw_struct.subscribe(radialstructs.RING_REMOVED, self._ring_removed)
+        self._canvas_changes = None
+        self._list_changes = None
+        self.pwapp.rebuild_views()
+
+    def detach(self, pw_struct):
+        for kind in radialstructs.RING_EVENTS:
+            pw_struct.unsubscribe(kind, self._ring_changed)
+        pw_struct.unsubscribe(radialstructs.RING_REMOVED, self._ring_removed)
+
+    def _ring_changed(self, change):
+        self._note_change(change.ring, False)
+
+    def _ring_removed(self, change):
+        self._note_change(change.ring, True)
+
+    def _note_change(self, ring, removed):
+        for changes in (self._canvas_changes, self._list_changes):
+            if changes is not None:
+                changes[str(ring.id)] = (ring, removed)
+        self.pwapp.rebuild_views()
 
     def create_canvas(self, *args, **kwargs):
         self.pw_canvas = PWCanvas(*args, **kwargs)
         self.pw_canvas.bind("<Button-1>", self._click_pw_canvas)
+        self.pw_canvas.bind("<B1-Motion>", self._drag_pw_canvas)
+        self.pw_canvas.bind("<ButtonRelease-1>", self._release_pw_canvas)
         self.pw_canvas.bind("<Double-Button-1>", self._double_click_pw_canvas)
+        self._drag_start = None
 
     def create_list(self, *args, **kwargs):
         self.pw_list = PWListBox(*args, **kwargs)
@@ -74,114 +188,172 @@ class PWViewer(PWWidget):
                 self._pw_interface_clear_selection)
 
     def rebuild(self):
-        '''Rebuild all aspects of the views to reflect current conditions.'''
+        '''Rebuild all aspects of the views to reflect current conditions,
+        including changes made without notification (e.g. from the
+        console).'''
+        self._canvas_changes = None
+        self._list_changes = None
         self._rebuild_pw_canvas()
         self._rebuild_pw_list()
 
+    @pwprofile.timed("draw")
     def _rebuild_pw_canvas(self):
-        '''Clear and then redraw the working_struct to the canvas.'''
-        log.debug("REDRAWING CANVAS")
-        self.pw_canvas.delete("all")
-        self.pwapp.working_struct.draw(self.pw_canvas)
-
+        '''Bring the canvas up to date. Only rings reported changed since
+        the last redraw are drawn: moved rings update their items in place,
+        selection changes just restyle them, and removed rings' items are
+        deleted. A full rebuild also deletes the items of any drawn ring no
+        longer in the struct, so removals it supersedes are not lost.'''
+        changes, self._canvas_changes = self._canvas_changes, {}
+        if changes is None:
+            log.debug("REDRAWING CANVAS")
+            ring_array = self.pwapp.working_struct.ring_array
+            for key, ring in self._drawn.items():
+                if ring_array.get(key) is not ring:
+                    ring.forget_canvas(self.pw_canvas)
+            self.pwapp.working_struct.draw(self.pw_canvas)
+            self._drawn = dict(ring_array.items())
+            self.item_count = sum(len(ring._canvas_items.get(self.pw_canvas,
+                    ())) for ring in self._drawn.values())
+        else:
+            for key, (ring, removed) in changes.items():
+                self.item_count -= len(ring._canvas_items.get(self.pw_canvas,
+                        ()))
+                if removed:
+                    ring.forget_canvas(self.pw_canvas)
+                    self._drawn.pop(key, None)
+                else:
+                    ring.draw(self.pw_canvas)
+                    self._drawn[key] = ring
+                    self.item_count += len(ring._canvas_items.get(
+                            self.pw_canvas, ()))
+        if self.highlight_overlaps or self._overlaps:
+            self._update_overlaps(changes)
+
+    def toggle_overlaps(self):
+        '''Turn highlighting of overlapping stickers on or off.'''
+        self.highlight_overlaps = not self.highlight_overlaps
+        self._update_overlaps(None)
+
+    def _update_overlaps(self, changes):
+        '''Recheck overlaps for the changed rings (all rings if changes is
+        None) and outline the stickers involved. Only rings whose highlights
+        changed are restyled.'''
+        pw_struct = self.pwapp.working_struct
+        old = self._overlaps
+        if not self.highlight_overlaps:
+            new = set()
+        elif changes is None:
+            new = {tuple(sorted(pair)) for pair in pw_struct.find_overlaps()}
+        else:
+            new = {pair for pair in old
+                    if pair[0][0] not in changes and pair[1][0] not in changes}
+            for ring, removed in changes.values():
+                if not removed:
+                    new.update(tuple(sorted(pair))
+                            for pair in pw_struct.overlaps_with(ring))
+        self._overlaps = new
+        conflicts = {}
+        for pair in new:
+            for key, k in pair:
+                conflicts.setdefault(key, set()).add(k)
+        touched = {key for pair in old ^ new for key, k in pair}
+        if changes is not None:
+            touched.update(key for key in changes if key in conflicts)
+        for key in touched:
+            ring = pw_struct.ring_array.get(key)
+            if ring is None:
+                continue
+            self.pw_canvas.itemconfigure("ring-" + key, **ring._item_style())
+            items = ring._canvas_items.get(self.pw_canvas, ())
+            for k in conflicts.get(key, ()):
+                if k < len(items):
+                    self.pw_canvas.itemconfigure(items[k],
+                            outline="#EA4335", width=2.0)
+
+    @pwprofile.timed("list rebuild")
     def _rebuild_pw_list(self):
-        '''Clear and then redraw the list. This lives here primarily so we
-        don't need to bother with re-sorting the ring_array evertime a new draw
-        call is issued. IID's are explicitly set to coincide with the
-        StickerRing.id to simplify lookups for click events.'''
-        log.debug("REBUILDING LIST")
-        self._clear_pw_list()
-        sorted_rings = sorted(self.pwapp.working_struct.ring_array.values(),
-            key=lambda ring: ring.radius)
-        log.debug("Sorted rings in prep for redrawing listbox; new order:")
-        for r in sorted_rings:
-             log.debug(r.radius)
-        for i, ring in enumerate(sorted_rings, start=1):
-            self.pw_list.insert(parent="", index=i, iid=int(ring.id),
-                text=i, values=ring.as_tuple())
-            # update selected state also from .selected prop! 
-            if ring.selected:
-                self.pw_list.selection_add(int(ring.id))
+        '''Bring the list up to date with the working_struct. Only rows for
+        rings reported changed are touched; see PWListBox.update_rows.'''
+        changes, self._list_changes = self._list_changes, {}
+        if changes is None:
+            self.pw_list.sync(self.pwapp.working_struct.ring_array.values())
+            return
+        self.pw_list.update_rows(
+                [ring for ring, removed in changes.values() if not removed],
+                [ring.id for ring, removed in changes.values() if removed])
 
     def _clear_pw_list(self):
-        for item in self.pw_list.get_children():
-            self.pw_list.delete(item)
+        self.pw_list.clear()
 
     def _click_pw_canvas(self, event):
         '''Handler for clicks on canvas.'''
+        self._drag_start = self._canvas_point(event)
         self._update_selected_ring_with_canvas_click(event)
 
+    def _canvas_point(self, event):
+        '''Canvas coordinates (origin at the center) of a mouse event.'''
+        return self.pw_canvas.canvasx(event.x), self.pw_canvas.canvasy(event.y)
+
+    def _ring_at(self, event):
+        '''The topmost ring with a sticker under the mouse, found
+        analytically (see pwhittest) rather than from canvas items.'''
+        x, y = self._canvas_point(event)
+        return pwhittest.hit_test(self.pwapp.working_struct.ring_array, x, y)
+
     def _update_selected_ring_with_canvas_click(self, event):
         '''Formerly _update_clicked_canvas_item
-        Bound to clicks on the pw_canvas. Checks for the tk 'CURRENT' tag,
-        which represents an item under the cursor, then update the
-        selected_ring array if it's determined a ring was clicked.
-         1. Toggle the .selected property if it's determined a ring was clicked,
-         2. Rebuild the interface's internal list of selected items,
-         3. Redraw the canvas,
-         4. Rebuild the pw_list_box from the ring_array,
-         5. Reset the input sliders (if applicable),
-         6. Reconfigure quantization on count slider per locked status.'''
-        #TODO: There's no reason to replicate the selection state to the
-        # working_struct and it's going to get us in trouble.
-        # pwapp.pw_interface_selected_rings should be the canonical and only
-        # record of this.
-        if self.pw_canvas.find_withtag(CURRENT):
-            clicked_obj_id = self.pw_canvas.find_withtag(CURRENT)[0]
-            log.debug("Clicked on object with id {0}".format(clicked_obj_id))
-            try:
-                # check if it's tagged as part of a ring...
-                clicked_ring_tag = next(
-                        tag for tag in self.pw_canvas.gettags(
-                            clicked_obj_id) if "ring-" in tag)
-                log.debug("The clicked object has the ring tag {0}".format(clicked_ring_tag))
-                clicked_ring = self.pwapp.working_struct.ring_array[clicked_ring_tag.strip("ring-")]
-                clicked_ring_id = clicked_ring_tag.strip("ring-")
-                log.debug("Adding to the selected_ring list the ring with "
-                        "key {0}".format(clicked_ring_id))
-            except NameError:
-                # it's possible we'll click an object other than a sticker
-                log.debug("A canvas object was clicked but no 'ring-*' tag was found. Must not be a ring object.")
-                return
+        Bound to clicks on the pw_canvas. Finds the ring under the cursor by
+        hit-testing the sticker layout, then toggles or sets the .selected
+        property if a ring was clicked. The views and input sliders update
+        themselves from the resulting selection-changed events.'''
+        clicked_ring = self._ring_at(event)
+        if clicked_ring is None:
+            log.debug("No sticker under the mouse, must not have clicked a "
+                    "ring.")
+            return
         # Determine action based on which modifier keys may be held down
         # Bitwise 'AND' of the bitmask returned by .state
-            if event.state & 0x004:
-                # Ctrl-key modifier is enabled
-                # Toggle the .selected state
-                clicked_ring.toggle_selected_state()
-                log.debug("Ctrl-clicked ring; toggled the selected state of "
-                        "the ring with key {0}".format(clicked_ring.id))
-            else:
-                # no Ctrl-key modifier; reset selection
-                for ring in self.pwapp.working_struct.ring_array.values():
-                    ring.selected = False
-                clicked_ring.selected = True
-                log.debug("Clicked a ring without Ctrl modifier; clearing "
-                        "previous selection and selecting ring with "
-                        "key {0}".format(clicked_ring.id))
-            # Rebuild the pw_interface_selected_rings from the updated data in
-            # the PanawaveStruct
-            self.pwapp.pw_interface_selected_rings = [ring for ring in \
-                    self.pwapp.working_struct.ring_array.values() if \
-                    ring.selected]
-            log.debug("New contents of pw_interface_selected_rings: {0}".format(
-                self.pwapp.pw_interface_selected_rings))
-            # Redraw with the newly-selected rings;
-            # rebuild the list_box with newly-selected rings.
-            self.rebuild()
-            # Reset or disable input sliders if ring(s) selected
-            if len(self.pwapp.pw_interface_selected_rings) is 1:
-                sel_ring = self.pwapp.pw_interface_selected_rings[0]
-                log.debug("Enabling and setting input sliders to selected "
-                    "ring values.")
-                self.pwapp.pw_controller.enable_inputs()
-                self.pwapp.pw_controller.set_inputs_for_ring_obj(sel_ring)
-            elif len(self.pwapp.pw_interface_selected_rings) > 1:
-                log.debug("Disabling inputs due to multiple selection.")
-                self.pwapp.pw_controller.clear_inputs()
-                self.pwapp.pw_controller.disable_inputs()
+        if event.state & 0x004:
+            # Ctrl-key modifier is enabled
+            # Toggle the .selected state
+            clicked_ring.toggle_selected_state()
+            log.debug("Ctrl-clicked ring; toggled the selected state of "
+                    "the ring with key {0}".format(clicked_ring.id))
         else:
-            log.debug("No CURRENT tag returned, must not have clicked an object.")
+            # no Ctrl-key modifier; reset selection
+            self.pwapp.working_struct.clear_selection()
+            clicked_ring.selected = True
+            log.debug("Clicked a ring without Ctrl modifier; clearing "
+                    "previous selection and selecting ring with "
+                    "key {0}".format(clicked_ring.id))
+
+    def _drag_pw_canvas(self, event):
+        '''Draw the rubber band while dragging across the canvas.'''
+        if self._drag_start is None:
+            return
+        x0, y0 = self._drag_start
+        x1, y1 = self._canvas_point(event)
+        if self.pw_canvas.find_withtag("rubber-band"):
+            self.pw_canvas.coords("rubber-band", x0, y0, x1, y1)
+        elif abs(x1 - x0) > 3 or abs(y1 - y0) > 3:
+            self.pw_canvas.create_rectangle(x0, y0, x1, y1,
+                    outline="#4285F4", dash=(4, 4), tags="rubber-band")
+
+    def _release_pw_canvas(self, event):
+        '''Select the rings with stickers inside the rubber band, if one was
+        drawn. With Ctrl held they are added to the selection.'''
+        start, self._drag_start = self._drag_start, None
+        if start is None or not self.pw_canvas.find_withtag("rubber-band"):
+            return
+        self.pw_canvas.delete("rubber-band")
+        x1, y1 = self._canvas_point(event)
+        rings = pwhittest.rings_in_rect(self.pwapp.working_struct.ring_array,
+                start[0], start[1], x1, y1)
+        log.debug("Rubber band selected {0} rings".format(len(rings)))
+        if not event.state & 0x004:
+            self.pwapp.working_struct.clear_selection()
+        for ring in rings:
+            ring.selected = True
 
     def _update_ring_selection_with_list_click(self, event):
         '''Formerly _update_ring_selection.  Bound to click events on
@@ -191,51 +363,29 @@ class PWViewer(PWWidget):
         panawave_struct. pw_list_box.selection() returns an IID; these are
         explicitly set when refreshing the list to make this lookup trivial.
         pw_list_box.selection() is stateful so we assume the values it returns
-        are canonical.
-        1. Propogate selected state back to the working_struct,
-        2. Update the interface's internal list of selected items,
-        3. Redraw the rings on canvas with new selections,
-        4. Reset the input sliders (if applicable),
-        5. Set pw_slider_count.quantize in accordance with the
-        persistent_state['unlocked_rings']'''
+        are canonical. Only rings whose state differs are changed; the
+        resulting selection-changed events update the canvas and inputs.'''
         # IID's are set at creation to coincide with .id property 
         # so we can directly look up the clicked item.
-
-        list_selection_array = self.pw_list.selection()
+        # With Ctrl or Shift held, rows selected but scrolled out of a
+        # virtualized list stay selected.
+        list_selection_array = self.pw_list.selection(
+                additive=bool(event.state & 0x005))
         log.debug("List box is reporting current selection as: {0}".format(
                 list_selection_array))
-        # Clear the interface's working list of selected items
-        self.pwapp.pw_interface_selected_rings = []
-        # there's probably a more clever way to do this with a list
-        # comprehension but the scoping issues with listcomps are way over
-        # my head at the moment:
-        # http://stackoverflow.com/q/13905741
-        # Just going to reset the .selected atribute on all rings then
-        # set it again based on what's reported by the TreeView.
-        for ring in self.pwapp.working_struct.ring_array.values():
-            ring.selected = False
-        for iid in list_selection_array:
-            selected_ring = self.pwapp.working_struct.ring_array[iid]
-            self.pwapp.pw_interface_selected_rings.append(selected_ring)
-            selected_ring.selected = True
-        self.pwapp.pw_controller.clear_inputs()
-        if len(self.pwapp.pw_interface_selected_rings) == 1:
-            log.debug("Exactly one ring selected; "
-                "setting input sliders to its values.")
-            sel_ring = self.pwapp.pw_interface_selected_rings[0]
-            self.pwapp.pw_controller.set_inputs_for_ring_obj(sel_ring)
-        elif len(self.pwapp.pw_interface_selected_rings) > 1:
-            log.debug("Disabling inputs due to multiple selection.")
-            self.pwapp.pw_controller.clear_inputs()
-            self.pwapp.pw_controller.disable_inputs()
-        self._rebuild_pw_canvas()
+        ring_array = self.pwapp.working_struct.ring_array
+        selection = set(list_selection_array)
+        for iid in ring_array.selected - selection:
+            ring_array[iid].selected = False
+        for iid in selection - ring_array.selected:
+            ring_array[iid].selected = True
 
     def _double_click_pw_canvas(self, event=None):
         '''Bound to double click on canvas. Clears ring selection if empty area
         is double-clicked. NOTE: Our single click handler will still fire!
         This is okay, because that handler does nothing when empty canvas is
         clicked.'''
-        if self.pw_canvas.find_withtag(CURRENT):
+        if self._ring_at(event) is not None:
             log.debug("Double clicked but there was an object under the mouse, "
                 "taking no action")
         else:
@@ -245,10 +395,7 @@ class PWViewer(PWWidget):
     def _pw_interface_clear_selection(self, event=None):
         '''Bound to ESC when pw_listbox has selection.'''
         # self.pw_list_box.selection_set('')
-        self.pwapp.pw_interface_selected_rings = []
-        for ring in self.pwapp.working_struct.ring_array.values():
-            ring.selected = False
-        self.rebuild()
+        self.pwapp.working_struct.clear_selection()
         log.debug("Cleared selection.")
 
 
@@ -274,7 +421,15 @@ class PWCanvas(PWWidget, tkinter.Canvas):
 
 
 class PWListBox(PWWidget, tkinter.Frame):
-    '''A listing of rings, using tkinter.Treeview for dumb reasons.'''
+    '''A listing of rings, using tkinter.Treeview for dumb reasons.
+
+    Rows are kept sorted by radius in an index of (radius, iid) keys, and
+    sync() applies only the differences to the Treeview. IID's are the
+    string form of StickerRing.id. Once there are more than
+    virtual_threshold rings, the list is virtualized: only the rows in view
+    exist in the Treeview, and the scrollbar drives which ones those are.'''
+
+    virtual_threshold = 2000
 
     def __init__(self, row=None, column=None, columnspan=None, **kwargs):
         # Parent frame for internal layout management
@@ -302,10 +457,22 @@ class PWListBox(PWWidget, tkinter.Frame):
         self.add_col("Count")
         self.add_col("Offset", text="Offset°")
 
+        # Sorted (radius, iid) keys of every ring, iid -> (radius, values,
+        # selected) as last synced, and iid -> values of the rows which
+        # currently exist in the Treeview.
+        self._keys = []
+        self._rows = {}
+        self._shown = {}
+        self._virtual = False
+        self._first = 0 # index of the first row shown when virtualized
+
         # Scrollbar
         self.scroll = ttk.Scrollbar(self, orient=VERTICAL,
-                command=self.list.yview)
+                command=self._yview)
         self.list['yscrollcommand'] = self.scroll.set
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.list.bind(sequence, self._mouse_wheel)
+        self.list.bind("<Configure>", self._render_window)
         # If we were to bind <Button-1>, our callback would be executed before
         # the selection changes and give us the *previous* selection.
 
@@ -332,12 +499,187 @@ class PWListBox(PWWidget, tkinter.Frame):
         self.list.column(heading, width=width, anchor=anchor)
         self.list.heading(heading, text=text)
 
-    def selection(self):
-        return self.list.selection()
+    def selection(self, additive=False):
+        '''IID's of the selected rows. When virtualized, rows scrolled out
+        of view can't be clicked, so they are included only if `additive`
+        (i.e. the click extended the selection rather than replacing it).'''
+        selection = self.list.selection()
+        if self._virtual and additive:
+            hidden = [iid for iid, row in self._rows.items()
+                    if row[2] and iid not in self._shown]
+            selection = tuple(selection) + tuple(hidden)
+        return selection
 
     def selection_add(self, id):
         self.list.selection_add(id)
 
+    def clear(self):
+        '''Remove every row.'''
+        self.list.delete(*self._shown)
+        self._keys = []
+        self._rows = {}
+        self._shown = {}
+        self._first = 0
+
+    def sync(self, rings):
+        '''Update the list to show exactly `rings`, inserting, moving,
+        updating and deleting only the rows which differ from before.'''
+        rows = {str(ring.id): self._row(ring) for ring in rings}
+        removed = [iid for iid in self._rows if iid not in rows]
+        self._apply(rows, removed, full=True)
+
+    def update_rows(self, rings=(), removed=()):
+        '''Update the rows of just the given rings (adding any which are
+        new) and delete the rows of the removed ring ids. The cost depends
+        only on the number of rings given.'''
+        rows = {str(ring.id): self._row(ring) for ring in rings}
+        self._apply(rows, [str(ring_id) for ring_id in removed], full=False)
+
+    def _row(self, ring):
+        return (ring.radius, ring.as_tuple(), ring.selected)
+
+    def _apply(self, rows, removed, full):
+        added = []
+        moved = []
+        for iid in removed:
+            row = self._rows.pop(iid, None)
+            if row is not None:
+                self._remove_key((row[0], iid))
+        for iid, row in rows.items():
+            old = self._rows.get(iid)
+            if old is None:
+                insort(self._keys, (row[0], iid))
+                added.append(iid)
+            elif old[0] != row[0]:
+                self._remove_key((old[0], iid))
+                insort(self._keys, (row[0], iid))
+                moved.append(iid)
+            self._rows[iid] = row
+        virtual = len(self._keys) > self.virtual_threshold
+        if virtual != self._virtual:
+            log.debug("{0} virtualized list mode with {1} rows".format(
+                "Entering" if virtual else "Leaving", len(self._keys)))
+            self.list.delete(*self._shown)
+            self._shown = {}
+            self._virtual = virtual
+            self.list['yscrollcommand'] = "" if virtual else self.scroll.set
+            added = [iid for radius, iid in self._keys]
+            moved = []
+            rows = self._rows
+            full = True
+        if self._virtual:
+            self._render_window()
+            self._sync_selection()
+            return
+        self._apply_diff(rows, removed, added, moved)
+        if full:
+            self._sync_selection()
+        else:
+            selected = [iid for iid, row in rows.items() if row[2]]
+            deselected = [iid for iid, row in rows.items() if not row[2]]
+            if selected:
+                self.list.selection_add(selected)
+            if deselected:
+                self.list.selection_remove(deselected)
+
+    def _remove_key(self, key):
+        del self._keys[bisect_left(self._keys, key)]
+
+    def _apply_diff(self, rows, removed, added, moved):
+        '''Update the Treeview's rows. Rows which moved are detached, then
+        moved and added rows are inserted in ascending order, so each
+        insertion index is already final.'''
+        removed = [iid for iid in removed if iid in self._shown]
+        if removed:
+            self.list.delete(*removed)
+        for iid in removed:
+            del self._shown[iid]
+        if moved:
+            self.list.detach(*moved)
+        for iid in sorted(added + moved,
+                key=lambda iid: (self._rows[iid][0], iid)):
+            index = bisect_left(self._keys, (self._rows[iid][0], iid))
+            values = self._rows[iid][1]
+            if iid in self._shown:
+                self.list.move(iid, "", index)
+            else:
+                self.list.insert(parent="", index=index, iid=iid,
+                        values=values)
+                self._shown[iid] = values
+        for iid, row in rows.items():
+            if self._shown.get(iid) != row[1]:
+                self.list.item(iid, values=row[1])
+                self._shown[iid] = row[1]
+
+    def _visible_rows(self):
+        '''Number of rows which fit in the Treeview, less one for the
+        headings.'''
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        return max(int(self.list.cget("height")),
+                self.list.winfo_height() // row_height - 1, 1)
+
+    def _render_window(self, event=None):
+        '''In virtualized mode, make the Treeview hold exactly the rows in
+        view starting at self._first, and update the scrollbar.'''
+        if not self._virtual:
+            return
+        visible = self._visible_rows()
+        total = len(self._keys)
+        self._first = max(0, min(self._first, total - visible))
+        window = [iid for radius, iid in
+                self._keys[self._first:self._first + visible]]
+        stale = [iid for iid in self._shown if iid not in self._rows or
+                iid not in window]
+        if stale:
+            self.list.delete(*stale)
+        for iid in stale:
+            del self._shown[iid]
+        for index, iid in enumerate(window):
+            values = self._rows[iid][1]
+            if iid not in self._shown:
+                self.list.insert(parent="", index=index, iid=iid,
+                        values=values)
+            else:
+                self.list.move(iid, "", index)
+                if self._shown[iid] != values:
+                    self.list.item(iid, values=values)
+            self._shown[iid] = values
+        if total:
+            self.scroll.set(self._first / total,
+                    min(total, self._first + visible) / total)
+        if event is not None:
+            self._sync_selection()
+
+    def _yview(self, *args):
+        '''Scrollbar command: scroll the Treeview itself, or move the
+        window of materialized rows when virtualized.'''
+        if not self._virtual:
+            return self.list.yview(*args)
+        visible = self._visible_rows()
+        if args[0] == "moveto":
+            self._first = int(round(float(args[1]) * len(self._keys)))
+        elif args[0] == "scroll":
+            step = visible if args[2] == "pages" else 1
+            self._first += int(args[1]) * step
+        self._render_window()
+        self._sync_selection()
+
+    def _mouse_wheel(self, event):
+        if not self._virtual:
+            return
+        if event.num == 4 or event.delta > 0:
+            self._yview("scroll", -3, "units")
+        else:
+            self._yview("scroll", 3, "units")
+        return "break"
+
+    def _sync_selection(self):
+        '''Select the shown rows whose rings are selected, touching the
+        Treeview only if its selection differs.'''
+        wanted = [iid for iid in self._shown if self._rows[iid][2]]
+        if set(self.list.selection()) != set(wanted):
+            self.list.selection_set(wanted)
+
 
 class PWController(PWWidget):
     '''PWController contains widgets which modify existing rings or create new
@@ -378,32 +720,63 @@ class PWController(PWWidget):
         self.pw_input_submit = PWButton(text="Create")
         self.pw_input_submit.config(command=self.submit_new_ring)
 
-    def update_active_ring_radius(self, rad):
-        if len(self.pwapp.pw_interface_selected_rings) == 1:
-            log.debug("updating ring radius with value: {0}".format(rad))
-            self.pwapp.pw_interface_selected_rings[0].set_radius(rad)
-            self.pwapp.rebuild_views()
+    def attach(self, pw_struct):
+        '''Follow a struct's selection changes. Called by
+        PanawaveApp.load_new_struct.'''
+        pw_struct.subscribe(radialstructs.RING_SELECTION_CHANGED,
+                self._selection_changed)
+
+    def detach(self, pw_struct):
+        pw_struct.unsubscribe(radialstructs.RING_SELECTION_CHANGED,
+                self._selection_changed)
+
+    def _selection_changed(self, change):
+        # A click can change the selection of many rings; update the
+        # inputs once, after the last of them.
+        self.pwapp.redraw_scheduler.set_value("selection-inputs",
+                self.set_inputs_for_selection, None)
+
+    def set_inputs_for_selection(self, *args):
+        '''Set and enable the input sliders for a single selected ring,
+        disable them for a multiple selection, and clear them when nothing
+        is selected.'''
+        selected = self.pwapp.pw_interface_selected_rings
+        if len(selected) == 1:
+            log.debug("Enabling and setting input sliders to selected "
+                "ring values.")
+            self.enable_inputs()
+            self.set_inputs_for_ring_obj(selected[0])
+        elif len(selected) > 1:
+            log.debug("Disabling inputs due to multiple selection.")
+            self.clear_inputs()
+            self.disable_inputs()
         else:
-            log.debug("Not updating ring properties because not exactly "
-                    "one ring selected.")
+            self.clear_inputs()
+            self.enable_inputs()
+
+    def update_active_ring_radius(self, rad):
+        self._update_active_ring("radius", "set_radius", rad)
 
     def update_active_ring_count(self, count):
-        if len(self.pwapp.pw_interface_selected_rings) == 1:
-            log.debug("updating ring count with value: {0}".format(count))
-            self.pwapp.pw_interface_selected_rings[0].set_count(int(count))
-            self.pwapp.rebuild_views()
-        else:
-            log.debug("Not updating ring properties because not exactly "
-                    "one ring selected.")
+        self._update_active_ring("count", "set_count", int(count))
 
     def update_active_ring_offset(self, deg):
+        self._update_active_ring("offset", "set_offset", deg)
+
+    def _update_active_ring(self, attribute, setter, value):
+        '''Queue an update of the selected ring with the redraw scheduler.
+        Only the latest value set before the next idle cycle is applied, and
+        the views are rebuilt once after it.'''
         if len(self.pwapp.pw_interface_selected_rings) == 1:
-            log.debug("updating ring offset with value: {0}".format(deg))
-            self.pwapp.pw_interface_selected_rings[0].set_offset(deg)
+            pwlogging.trace("Updating ring", attribute=attribute,
+                    value=value)
+            ring = self.pwapp.pw_interface_selected_rings[0]
+            self.pwapp.redraw_scheduler.set_value((ring.id, attribute),
+                    getattr(ring, setter), value)
             self.pwapp.rebuild_views()
         else:
-            log.debug("Not updating ring properties because not exactly "
-                    "one ring selected.")
+            pwlogging.trace("Not updating ring properties because not "
+                    "exactly one ring selected")
 
     def submit_new_ring(self, *args):
         '''validate the input and submit it to our current struct.
@@ -421,7 +794,6 @@ class PWController(PWWidget):
                 self.pw_slider_radius.get_value(),
                 self.pw_slider_count.get_value(),
                 self.pw_slider_offset.get_value())
-        self.pwapp.working_struct.draw(self.pwapp.viewer.pw_canvas)
         # reset focus for a new ring entry
         self.pw_slider_radius.input_box.focus_set()
         self.pwapp.rebuild_views()
@@ -438,13 +810,13 @@ class PWController(PWWidget):
     def set_inputs_for_ring_obj(self, sticker_ring_obj):
         '''Should be called whenever a new ring is selected. Use this rather
         than setting sliders directly with set_inputs in order to take in
-        account the ring's 'unlocked_rings' state, as well.'''
+        account the ring's locked/unlocked count state, as well.'''
         r = sticker_ring_obj
         (rad, count, offset) = r.radius, \
             r.count, \
             r.offsetDegrees
         self.set_inputs(rad, count, offset)
-        if r.id in self.pwapp.working_struct.persistent_state['unlocked_rings']:
+        if not self.pwapp.working_struct.is_count_locked_for_ring(r):
             self.pw_slider_count.quantize = 0
         else:
             self.pw_slider_count.quantize = 1 / len(r.scaler_list)
@@ -548,23 +920,19 @@ class PWSlider(tkinter.Frame, PWWidget):
         predictable values, as ttk.Scale's quantization does not correct for
         floating point math errors.'''
         if (self.quantize == 0 or self.quantize >= 1):
-            log.debug("Quantizing value to nearest "
-                     "{0}  decimals".format(str(self.quantize)))
             new_val = round(val, int(self.quantize))
             if new_val % 1 == 0:
                 new_val = int(new_val) # cast ints to ints for display
-            log.debug("Raw value: {0}; quantized value: {1}".format(
-                    str(val), str(new_val)))
+            pwlogging.trace("Quantized value", raw=val, quantized=new_val,
+                    decimals=self.quantize)
             return new_val
         elif 0 < self.quantize < 1:
             step = int(1 / self.quantize)
-            log.debug("Quantizing value to whole number units of {0}".format(
-                    str(step)))
             new_val = int(val // step * step)
             if val % step:
                 new_val = new_val + step # round up instead of down
-            log.debug("Raw value: {0}; quantized value: {1}".format(
-                    str(val), str(new_val)))
+            pwlogging.trace("Quantized value", raw=val, quantized=new_val,
+                    step=step)
             return new_val
         else:
             return val
@@ -573,8 +941,8 @@ class PWSlider(tkinter.Frame, PWWidget):
         '''Passes the value from slider to input box and sets var when
         adjusted.'''
         new_val = self._quantize_value(self.scale.get())
-        log.debug("Updating input_box value due to slider adjustment, "
-            "new val: {0}".format( new_val))
+        pwlogging.trace("Updating input_box value due to slider adjustment",
+                value=new_val)
         self.input_box.delete(0, END)
         self.input_box.insert(0, new_val)
         self.setter_callback(new_val)
@@ -585,8 +953,8 @@ class PWSlider(tkinter.Frame, PWWidget):
         new_val = self.input_box.get()
         if new_val == "":
             new_val = 0
-        log.debug("Updating scale value due to input_box adjustment, "
-            "new val: {0}".format(new_val))
+        pwlogging.trace("Updating scale value due to input_box adjustment",
+                value=new_val)
         self.scale.set(new_val)
         self.setter_callback(new_val)
 
@@ -673,8 +1041,23 @@ class PWPeriodController(PWWidget, tkinter.Frame):
         self.pw_pattern_input_label.pack(anchor='w', pady=4)
         self.pw_chkbx_pattern_lock.pack(anchor='w', pady=4)
 
-        # Attempt to bind to selection
+        # Attempt to bind to selection, and follow it while we exist
         self.bind_to_ring(self.pwapp.pw_interface_selected_rings)
+        self.pwapp.working_struct.subscribe(
+                radialstructs.RING_SELECTION_CHANGED, self._selection_changed)
+        self.bind("<Destroy>", self._unsubscribe)
+
+    def _selection_changed(self, change):
+        self.pwapp.redraw_scheduler.set_value((self, "selection"),
+                self._rebind_to_selection, None)
+
+    def _rebind_to_selection(self, *args):
+        if self.winfo_exists() and self.pwapp.pw_interface_selected_rings:
+            self.bind_to_ring(self.pwapp.pw_interface_selected_rings)
+
+    def _unsubscribe(self, event=None):
+        self.pwapp.working_struct.unsubscribe(
+                radialstructs.RING_SELECTION_CHANGED, self._selection_changed)
 
     def _entry_handler(self, string_var):
         '''Callback attached to updates of the 'Complex' text entry.'''
@@ -764,7 +1147,6 @@ class PWPeriodController(PWWidget, tkinter.Frame):
             log.debug("updating scaler_list of ring {0} with value: {1}".format(
                 repr(ring), repr(scaler_list)))
             ring.set_scaler_list(scaler_list)
-        self.pwapp.viewer._rebuild_pw_canvas()
 
     def update_active_ring_lock_status(self, event=None):
         lock = self.lock_var.get()
@@ -778,7 +1160,6 @@ class PWPeriodController(PWWidget, tkinter.Frame):
 
     def update_lock_checkbox_with_active_ring_status(self):
         '''If any selected ring is locked, set checkbox to checked state.'''
-        unlock_l = self.pwapp.working_struct.persistent_state['unlocked_rings']
         l = False
         for ring in self.pwapp.pw_interface_selected_rings:
             if self.pwapp.working_struct.is_count_locked_for_ring(ring):
@@ -817,7 +1198,12 @@ class PWAnimController(PWWidget, tkinter.Frame):
         self.toggle_button.grid(row=0, column=1, rowspan=2, padx=4, pady=2)
         self.speedslider = ttk.Scale(self, orient=HORIZONTAL, from_=0, to=3,
                 value=1.5, takefocus=False, command=self._set_anim_speed)
+        self.speedslider.bind("<ButtonRelease-1>", self._release_anim_speed)
         self.speedslider.grid(row=1, column=0, sticky=(W,E), pady=2)
+        self.loop_var = tkinter.BooleanVar(value=False)
+        self.loop_check = ttk.Checkbutton(self, text="Loop",
+                variable=self.loop_var, command=self._set_anim_loop)
+        self.loop_check.grid(row=0, column=2, rowspan=2, padx=4, pady=2)
         self.grid(row=row, column=column, columnspan=columnspan, sticky=(E,W),
                 pady=4)
         self.columnconfigure(0, weight=1)
@@ -836,9 +1222,24 @@ class PWAnimController(PWWidget, tkinter.Frame):
     def _set_anim_speed(self, speed):
         '''Adjust animation speed scaler of working_struct and restart
         animation if currently active. Currently, the default for this value is
-        1.5 so this is mapped to the center of the slider.'''
+        1.5 so this is mapped to the center of the slider. A looping
+        animation is only restarted once the slider is released, as each
+        restart precomputes a whole new loop.'''
         self.pwapp.working_struct.persistent_state['master_orbit_speed'] = \
             float(speed) # stupid ttk.Scale returns a string
+        if not self.loop_var.get():
+            self.restart_if_animating()
+
+    def _release_anim_speed(self, event):
+        if self.loop_var.get():
+            self.restart_if_animating()
+
+    def _set_anim_loop(self):
+        '''Switch between computing every frame and playing a precomputed
+        seamless loop (see PanawaveStruct.cache_loop), restarting the
+        animation if currently active.'''
+        self.pwapp.working_struct.ephemeral_state['loop'] = \
+            self.loop_var.get()
         self.restart_if_animating()
 
     def toggle_animation(self):
@@ -847,7 +1248,8 @@ class PWAnimController(PWWidget, tkinter.Frame):
             self.pwapp.pw_anim_control.toggle_button.configure(text="Start")
         else:
             self.pwapp.working_struct.orbit(
-                    method=self.methods[self.combo.get()])
+                    method=self.methods[self.combo.get()],
+                    loop=self.loop_var.get())
             self.pwapp.pw_anim_control.toggle_button.configure(text="Stop")
 
     def restart_if_animating(self):
@@ -856,7 +1258,106 @@ class PWAnimController(PWWidget, tkinter.Frame):
         if self.pwapp.working_struct.ephemeral_state['animating'] is True:
             meth = self.pwapp.working_struct.ephemeral_state['anim_method']
             self.pwapp.working_struct.stop_animation()
-            self.pwapp.working_struct.orbit(method=meth)
+            self.pwapp.working_struct.orbit(method=meth,
+                    loop=self.loop_var.get())
+
+
+class PWHud(PWWidget):
+    '''A performance overlay on the canvas: frame rate and frame time while
+    the orbit animates, time spent computing geometry and drawing, the
+    number of stickers and canvas items, and the geometry cache hit rate.
+    The figures come from counters which are kept anyway (FrameStats,
+    pwprofile's subsystem timers and the geometry cache), and are only
+    gathered while the overlay is shown. The sticker total is kept from the
+    struct's ring events and the item total by the viewer, so a refresh
+    does not visit every ring.'''
+
+    refresh_ms = 500
+
+    def __init__(self, master=None):
+        if master:
+            self.master = master
+        self.hud_label = tkinter.Label(self.master, justify=tkinter.LEFT,
+                font="TkFixedFont", background="black", foreground="#34A853")
+        self.shown = False
+        self._after_id = None
+        self._geometry_mark = (0, 0.0)
+        # key -> sticker count of every ring, and their total
+        self._counts = {}
+        self.sticker_count = 0
+
+    def attach(self, pw_struct):
+        '''Count a (newly loaded) struct's stickers and follow its ring
+        changes. Called by PanawaveApp.load_new_struct.'''
+        self._counts = {key: ring.count
+                for key, ring in pw_struct.ring_array.items()}
+        self.sticker_count = sum(self._counts.values())
+        for kind in (radialstructs.RING_ADDED,
+                radialstructs.RING_GEOMETRY_CHANGED):
+            pw_struct.subscribe(kind, self._ring_changed)
+        pw_struct.subscribe(radialstructs.RING_REMOVED, self._ring_removed)
+
+    def detach(self, pw_struct):
+        for kind in (radialstructs.RING_ADDED,
+                radialstructs.RING_GEOMETRY_CHANGED):
+            pw_struct.unsubscribe(kind, self._ring_changed)
+        pw_struct.unsubscribe(radialstructs.RING_REMOVED, self._ring_removed)
+
+    def _ring_changed(self, change):
+        key = str(change.ring.id)
+        self.sticker_count += change.ring.count - self._counts.get(key, 0)
+        self._counts[key] = change.ring.count
+
+    def _ring_removed(self, change):
+        self.sticker_count -= self._counts.pop(str(change.ring.id), 0)
+
+    def draw_hud(self):
+        self.shown = True
+        self.hud_label.place(relx=0.02, rely=0.02)
+        self._refresh()
+
+    def hide_hud(self):
+        self.shown = False
+        self.hud_label.place_forget()
+        if self._after_id is not None:
+            self.master.after_cancel(self._after_id)
+            self._after_id = None
+
+    def toggle_hud(self):
+        if self.shown:
+            self.hide_hud()
+        else:
+            self.draw_hud()
+
+    def _refresh(self):
+        self.hud_label.config(text=self.report())
+        self._after_id = self.master.after(self.refresh_ms, self._refresh)
+
+    def report(self):
+        '''The overlay's text.'''
+        pw_struct = self.pwapp.working_struct
+        lines = []
+        scheduler = pw_struct._frame_scheduler
+        if scheduler is not None and scheduler.running:
+            frame_stats = pw_struct.frame_stats
+            lines.append("fps      {0:7.1f}".format(frame_stats.fps()))
+            lines.append("frame    {0:7.1f} ms".format(
+                frame_stats.mean_frame_time() * 1000))
+        else:
+            lines.append("fps         idle")
+        # geometry computed since the last refresh, often several rings
+        geometry = pwprofile.timer("geometry")
+        count, total = self._geometry_mark
+        self._geometry_mark = (geometry.count, geometry.total)
+        lines.append("geometry {0:7.2f} ms ({1} rings)".format(
+            (geometry.total - total) * 1000, geometry.count - count))
+        lines.append("redraw   {0:7.2f} ms".format(
+            pwprofile.timer("draw").last * 1000))
+        lines.append("stickers {0:7d}".format(self.sticker_count))
+        lines.append("items    {0:7d}".format(self.pwapp.viewer.item_count))
+        lines.append("cache    {0:7.1%} hits".format(
+            pwgeometry.geometry_cache.hit_rate()))
+        return "\n".join(lines)
 
 
 class PWConsole(PWWidget):
@@ -895,7 +1396,8 @@ class PWConsole(PWWidget):
             e = sys.exc_info()
             log.debug("***Console input generated the following error:***")
             log.debug(e)
-        self.pwapp.rebuild_views()
+        # statements may change rings directly, without change events
+        self.pwapp.viewer.rebuild()
         sleep(.5)
         self.console_history_offset = 0
         self.console_input.delete(0, END)
@@ -1,10 +1,38 @@
+from bisect import bisect_left, insort
+from collections import namedtuple
+from collections.abc import Mapping
 import logging as log
 from math import degrees, radians
 from cmath import exp
-from random import random, randint
-from time import sleep
+from itertools import count as _count
+from random import random
+from time import perf_counter, sleep
 import json
 import os
+import re
+
+import pwanimation
+import pwformat
+import pwgeometry
+import pwlogging
+import pwloop
+import pwprofile
+import pwoverlap
+import pwplotter
+import pwvector
+
+# Orbit speeds are expressed in degrees per orbit tick. A tick was
+# originally one 100ms animation frame, so this keeps existing speeds.
+ORBIT_TICK_RATE = 10
+
+
+def pw_json_serializer(object):
+    '''generic method for representing objects in json. will use an
+    object's _as_json method if found.'''
+    try :
+        return object._as_json()
+    except (NameError, AttributeError):
+        return object.__dict__
 
 
 class RotatingPoly:
@@ -102,6 +130,22 @@ class PanawavePolygon:
         canvas.create_polygon(*self.points)
 
 
+# Kinds of change emitted by PanawaveStruct; see PanawaveStruct.subscribe.
+RING_ADDED = "ring-added"
+RING_REMOVED = "ring-removed"
+RING_GEOMETRY_CHANGED = "geometry-changed"
+RING_SELECTION_CHANGED = "selection-changed"
+RING_EVENTS = (RING_ADDED, RING_REMOVED, RING_GEOMETRY_CHANGED,
+        RING_SELECTION_CHANGED)
+
+RingChange = namedtuple("RingChange", "kind ring")
+
+
+# Ids for rings created outside of a RingRegistry; the registry reassigns
+# any that collide when the ring is added.
+_ring_ids = _count(1)
+
+
 class StickerRing:
     '''create and manage a ring of regularly-spaced poly objects.
     There's less math if we just throw the polys out and create a
@@ -113,39 +157,76 @@ class StickerRing:
     def __init__(self, radius, count, offsetDegrees=0, scaler_list=[1],
             geometry=None, id=None):
         if id is None:
-            self.id = randint(10000,99999)
+            self.id = next(_ring_ids)
         else:
             self.id = id
-        self.selected = False #TODO kill this
+        # The RingRegistry this ring belongs to, if any; kept informed of
+        # radius and selection changes so its indexes stay current.
+        self._registry = None
+        self._selected = False
+        # canvas -> [item ids], canvas -> selected state the items were
+        # last styled with, and canvas -> _revision the items were last
+        # positioned at. See draw().
+        self._canvas_items = {}
+        self._canvas_styles = {}
+        self._canvas_revisions = {}
+        # Incremented whenever the displayed geometry changes.
+        self._revision = 0
+        # Rotation applied on top of offsetDegrees while orbiting; the
+        # computed geometry itself is never modified by the animation.
+        self._orbit_rotation = 0.0
         if geometry is not None:
             self.baseStickerPoly = geometry
         self.radius = float(radius)
         self.count = int(count)
         self.offsetDegrees = float(offsetDegrees)
         self.scaler_list = scaler_list
-        log.debug("New ring being initialized with radius {0}, count {1}, "
-                "offset {2}, and scaler_list {3}".format(
-                    repr(self.radius),
-                    repr(self.count),
-                    repr(self.offsetDegrees),
-                    repr(self.scaler_list)))
+        pwlogging.trace("New ring initialized", radius=self.radius,
+                count=self.count, offset=self.offsetDegrees,
+                scaler_list=self.scaler_list)
         self._initialize_geometry()
 
     def _initialize_geometry(self):
+        '''Recalculate the increment and mark the sticker geometry as stale.
+        The geometry itself is computed on first use (see vertices), so a
+        ring which is created or changed several times before being drawn
+        is only computed once.'''
         self.increment = self._get_increment_val()
-        self.sticker_list = []
-        prev_offset = 0
-        for s in self._stepper(self.count, self.scaler_list):
-            p = PanawavePolygon(self.baseStickerPoly)
-            # center the centroid at canvas origin before other moves
-            p.translate((0 - p.centroid[0]), (0 - p.centroid[1]))
-            p.translate(0, self.radius)
-            curr_offset = prev_offset + self.increment * s
-            p.rotate_about_origin(
-                    self.offsetDegrees + \
-                    curr_offset)
-            self.sticker_list.append(p)
-            prev_offset = curr_offset
+        self._geometry = None
+        self._revision += 1
+        if self._registry is not None:
+            self._registry._notify(RING_GEOMETRY_CHANGED, self)
+
+    @pwprofile.timed("geometry")
+    def _compute_geometry(self):
+        '''Compute the geometry of every sticker at once (see
+        pwgeometry.ring_geometry), or fetch it from the shared geometry
+        cache if a ring with the same parameters was computed recently.'''
+        self._geometry = pwgeometry.geometry_cache.ring_geometry(
+                self.baseStickerPoly,
+                self.radius,
+                self.count,
+                self.offsetDegrees,
+                self.scaler_list,
+                self.increment)
+        return self._geometry
+
+    @property
+    def vertices(self):
+        '''Vertices of every sticker, shaped (count, n_vertices, 2).'''
+        return (self._geometry or self._compute_geometry())[0]
+
+    @property
+    def centroids(self):
+        '''Centroid of every sticker, shaped (count, 2).'''
+        return (self._geometry or self._compute_geometry())[1]
+
+    @property
+    def sticker_list(self):
+        '''Sequence of PanawavePolygons representing the ring's stickers.
+        Individual stickers remain accessible this way for compatibility.'''
+        return pwgeometry.StickerListView(self.vertices, self.centroids,
+                PanawavePolygon)
 
     def _stepper(self, steps, scaler_list, step_val=None):
         '''Generator for scalers, as determined from the scaler_list
@@ -164,22 +245,18 @@ class StickerRing:
         and self.count is the actual count of stickers. Rings which are not
         evenly divisible by the scaler list are possible; but they will not
         have clean radial symmetry.'''
-
-        # That said....this *would* be easier if we only allowed divis. counts:
-        #   full_sc_list = self.scaler_list * count
-        #   incr = 360 / sum(full_sl_list)
-        full_scaler_list = []
-        for s in range(self.count):
-            full_scaler_list.append(self.scaler_list[s % len(self.scaler_list)])
-        increment = 360 / sum(full_scaler_list)
-        log.debug("Calculated new ring increment of {0} from "
-                "scaler_list: {1}".format(
-                str(increment), repr(self.scaler_list)))
+        increment = 360 / pwgeometry.full_scaler_sum(self.count,
+                self.scaler_list)
+        pwlogging.trace("Calculated ring increment", increment=increment,
+                scaler_list=self.scaler_list)
         return increment
 
     def set_radius(self, new_radius):
         '''Setter for radius; will re-initialize the object.'''
+        old_radius = self.radius
         self.radius = float(new_radius)
+        if self._registry is not None:
+            self._registry._radius_changed(self, old_radius)
         self._initialize_geometry()
 
     def set_count(self, new_count):
@@ -212,64 +289,432 @@ class StickerRing:
         ring_tuple = (self.radius, self.count, self.offsetDegrees)
         return ring_tuple
 
+    def _as_json(self):
+        '''Representation used by pw_json_serializer. Private attributes
+        (such as the geometry arrays) are skipped; stickers are written out
+        through the sticker_list view in the same layout as before.'''
+        rep = {key: val for key, val in self.__dict__.items()
+                if not key.startswith('_')}
+        rep['selected'] = self.selected
+        rep['sticker_list'] = self.sticker_list._as_json()
+        return rep
+
+    @property
+    def selected(self):
+        return self._selected
+
+    @selected.setter
+    def selected(self, selected):
+        '''Selection is tracked by the registry as well, so the selected
+        rings can be found without scanning them all.'''
+        self._selected = bool(selected)
+        if self._registry is not None:
+            self._registry._selection_changed(self)
+
     def toggle_selected_state(self):
         '''Toggles .selected property.'''
         self.selected = not self.selected
 
     def draw(self, canvas):
-        '''plot stickerRing to a canvas'''
+        '''plot stickerRing to a canvas. Canvas items are retained between
+        calls: the first draw creates one polygon per sticker, subsequent
+        draws only move the existing items with canvas.coords, and only if
+        the ring has changed since it was last drawn to that canvas. Items
+        are recreated only if the sticker count has changed, and a change of
+        selection only restyles them. If the canvas is cleared by other
+        means, call forget_canvas() first.'''
         ring_tag = "ring-" + str(self.id)
-        for sticker in self.sticker_list:
-            if self.selected:
-                # TODO maybe some fancy intereference-detection on stickers
-                # that are touching.
-                canvas.create_polygon(*sticker.points, outline="#4285F4",
-                        width=2.0, tags=ring_tag)
+        items = self._canvas_items.get(canvas)
+        if self._canvas_revisions.get(canvas) != self._revision:
+            coords_list = pwgeometry.flat_coords(self.displayed_vertices())
+            if items is not None and len(items) == len(coords_list):
+                for item, coords in zip(items, coords_list):
+                    canvas.coords(item, coords)
             else:
-                canvas.create_polygon(*sticker.points, tags=ring_tag)
+                if items:
+                    canvas.delete(ring_tag)
+                # Overlapping stickers are found by pwoverlap, and
+                # highlighted by PWViewer.
+                style = self._item_style()
+                items = [canvas.create_polygon(*coords, tags=ring_tag,
+                    **style) for coords in coords_list]
+                self._canvas_items[canvas] = items
+                self._canvas_styles[canvas] = self.selected
+                if items and self._registry is not None:
+                    # new items go on top; keep them at the ring's place in
+                    # the drawing order, which hit-testing relies on
+                    above = self._registry.drawn_above(self, canvas)
+                    if above is not None:
+                        canvas.tag_lower(ring_tag, "ring-" + str(above.id))
+            self._canvas_revisions[canvas] = self._revision
+        if self._canvas_styles.get(canvas) != self.selected:
+            canvas.itemconfigure(ring_tag, **self._item_style())
+            self._canvas_styles[canvas] = self.selected
+
+    def displayed_vertices(self):
+        '''Sticker vertices as currently displayed, i.e. including any orbit
+        rotation.'''
+        if self._orbit_rotation:
+            return pwgeometry.rotate_vertices(self.vertices,
+                    self._orbit_rotation)
+        return self.vertices
+
+    def displayed_offset(self):
+        '''Offset in degrees as currently displayed, including any orbit
+        rotation.'''
+        return (self.offsetDegrees + self._orbit_rotation) % 360
+
+    def set_orbit_rotation(self, angle):
+        '''Set the rotation displayed on top of offsetDegrees. This does not
+        recompute the ring's geometry; see PanawaveStruct.seek_orbit.'''
+        angle = angle % 360
+        if angle != self._orbit_rotation:
+            self._orbit_rotation = angle
+            self._revision += 1
+
+    def commit_orbit_rotation(self):
+        '''Fold the current orbit rotation into offsetDegrees, recomputing
+        the geometry once.'''
+        if self._orbit_rotation:
+            rotation = self._orbit_rotation
+            self._orbit_rotation = 0.0
+            self.set_offset((self.offsetDegrees + rotation) % 360)
+
+    def _item_style(self):
+        '''Canvas item options for the ring's current selection state.'''
+        if self.selected:
+            return {"outline": "#4285F4", "width": 2.0}
+        else:
+            return {"outline": "", "width": 1.0}
+
+    def forget_canvas(self, canvas, delete=True):
+        '''Drop the ring's retained items on the given canvas, deleting them
+        from the canvas unless delete is False (e.g. because the canvas was
+        already cleared).'''
+        items = self._canvas_items.pop(canvas, None)
+        self._canvas_styles.pop(canvas, None)
+        self._canvas_revisions.pop(canvas, None)
+        if items and delete:
+            canvas.delete("ring-" + str(self.id))
 
     def rotate(self, angle):
         '''rotate the StickerRing. Use this instead of accessing the offset
         directly.'''
-        for sticker in self.sticker_list:
-            sticker.rotate_about_origin(angle)
         self.offsetDegrees = self.offsetDegrees + angle
         if self.offsetDegrees > 360:
             self.offsetDegrees = self.offsetDegrees - 360
+        self._initialize_geometry()
+
+
+_whitespace = re.compile(r"\s*")
+
+
+def _read_json_documents(text, source="<string>"):
+    '''Yield each JSON document from a string of concatenated documents. If
+    the text is damaged after the first document, a warning is logged and
+    the documents decoded so far are kept; if not even the first document
+    can be read, ValueError is raised.'''
+    decoder = json.JSONDecoder()
+    position = _whitespace.match(text, 0).end()
+    count = 0
+    while position < len(text):
+        try:
+            document, position = decoder.raw_decode(text, position)
+        except ValueError as e:
+            if count == 0:
+                raise ValueError("{0} is not a readable Panawave file: "
+                        "{1}".format(source, e))
+            log.warning("{0} is truncated or damaged after document {1}; "
+                    "loading what was read. ({2})".format(source, count, e))
+            return
+        count += 1
+        yield document
+        position = _whitespace.match(text, position).end()
+
+
+def _ring_kwargs_from_record(record, base_sticker=None):
+    '''Map a saved ring (in any of the saved formats) to StickerRing
+    arguments.'''
+    kwargs = {
+        "radius": record["radius"],
+        "count": record["count"],
+        "offsetDegrees": record.get("offsetDegrees", 0),
+        "scaler_list": [int(s) for s in record.get("scaler_list") or [1]],
+        }
+    if record.get("id") is not None:
+        kwargs["id"] = int(record["id"])
+    geometry = record.get("baseStickerPoly") or record.get("base_sticker") \
+            or base_sticker
+    if isinstance(geometry, dict):
+        geometry = geometry["points"]
+    if geometry is not None:
+        kwargs["geometry"] = [list(point) for point in geometry]
+    return kwargs
+
+
+class RingRegistry(Mapping):
+    '''The rings of a PanawaveStruct, keyed on str(ring.id) (iterating it
+    yields the keys, like the dict it replaces). Besides lookup by id, it
+    keeps:
+
+      - monotonic ids: new_id() never returns an id in use, and rings
+        added with a saved id keep it (adding a ring whose id is in use is
+        an error; the loaders give such rings a new id themselves);
+      - a secondary index of (radius, key) sorted by radius, for ordered
+        iteration and radius range queries. It is rebuilt lazily, so bulk
+        loads don't pay for sorted inserts;
+      - the set of keys whose count is unlocked from the scaler_list;
+      - the set of keys of selected rings;
+      - each ring's drawing order (rings added later are drawn on top) and
+        the farthest any sticker reaches from its position on its ring,
+        for hit-testing (see pwhittest).
+
+    Changes are reported by calling notify(kind, ring), with one of the
+    RING_* kinds.'''
+
+    def __init__(self, notify=None):
+        self._notify = notify or (lambda kind, ring: None)
+        self._rings = {}
+        self._order = {}
+        self._added = 0
+        # canvas -> highest draw order of a ring drawn to it; see drawn_above
+        self._canvas_tops = {}
+        self._reaches = {}
+        self.max_sticker_reach = 0.0
+        self._next_id = 1
+        self._radius_index = []
+        self._radius_index_valid = True
+        self.unlocked = set()
+        self.selected = set()
+
+    def __getitem__(self, key):
+        return self._rings[str(key)]
+
+    def __contains__(self, key):
+        return str(key) in self._rings
+
+    def __iter__(self):
+        return iter(self._rings)
+
+    def __len__(self):
+        return len(self._rings)
+
+    def _as_json(self):
+        return self._rings
+
+    def new_id(self):
+        '''Allocate an id not used by any ring in the registry.'''
+        new_id = self._next_id
+        self._next_id += 1
+        return new_id
+
+    def add(self, ring):
+        '''Add a ring. Its id must not be in use already (see new_id):
+        other state, such as saved unlocked ids, refers to rings by id, so
+        silently renaming the ring would leave that pointing elsewhere.'''
+        if str(ring.id) in self._rings:
+            raise ValueError("Ring id {0} is already in use".format(ring.id))
+        if int(ring.id) >= self._next_id:
+            self._next_id = int(ring.id) + 1
+        key = str(ring.id)
+        self._rings[key] = ring
+        self._order[key] = self._added
+        self._added += 1
+        # max_sticker_reach only grows; it is a bound, not an exact value.
+        geometry = tuple(tuple(point) for point in ring.baseStickerPoly)
+        if geometry not in self._reaches:
+            self._reaches[geometry] = pwgeometry.bounding_radius(geometry)
+            self.max_sticker_reach = max(self.max_sticker_reach,
+                    self._reaches[geometry])
+        ring._registry = self
+        if ring.selected:
+            self.selected.add(key)
+        if self._radius_index_valid:
+            self._radius_index.append((ring.radius, key))
+            self._radius_index_valid = len(self._radius_index) < 2 or \
+                    self._radius_index[-2] <= self._radius_index[-1]
+        self._notify(RING_ADDED, ring)
+        return ring
+
+    def remove(self, ring):
+        '''Remove a ring (or the ring with the given id).'''
+        if not isinstance(ring, StickerRing):
+            ring = self[ring]
+        key = str(ring.id)
+        del self._rings[key]
+        del self._order[key]
+        ring._registry = None
+        self.unlocked.discard(key)
+        self.selected.discard(key)
+        if self._radius_index_valid:
+            del self._radius_index[bisect_left(self._radius_index,
+                (ring.radius, key))]
+        self._notify(RING_REMOVED, ring)
+        return ring
+
+    def _radius_changed(self, ring, old_radius):
+        if self._radius_index_valid:
+            key = str(ring.id)
+            del self._radius_index[bisect_left(self._radius_index,
+                (old_radius, key))]
+            insort(self._radius_index, (ring.radius, key))
+
+    def _selection_changed(self, ring):
+        if ring.selected:
+            self.selected.add(str(ring.id))
+        else:
+            self.selected.discard(str(ring.id))
+        self._notify(RING_SELECTION_CHANGED, ring)
+
+    def _sorted_index(self):
+        if not self._radius_index_valid:
+            self._radius_index = sorted((ring.radius, key)
+                    for key, ring in self._rings.items())
+            self._radius_index_valid = True
+        return self._radius_index
+
+    def by_radius(self):
+        '''Rings in increasing order of radius.'''
+        return [self._rings[key] for radius, key in self._sorted_index()]
+
+    def in_radius_range(self, low, high):
+        '''Rings with low <= radius <= high, in increasing order of radius.'''
+        index = self._sorted_index()
+        start = bisect_left(index, (low,))
+        rings = []
+        for radius, key in index[start:]:
+            if radius > high:
+                break
+            rings.append(self._rings[key])
+        return rings
+
+    def draw_order(self, ring):
+        '''Position of the ring in drawing order; higher is drawn on top.'''
+        return self._order[str(ring.id)]
+
+    def drawn_above(self, ring, canvas):
+        '''The first ring after the given one in drawing order which has
+        items on the canvas, or None. Called by StickerRing.draw whenever it
+        creates items, so that it can restack them; rings drawn in order
+        (as by PanawaveStruct.draw) return without searching.'''
+        key = str(ring.id)
+        order = self._order[key]
+        if order >= self._canvas_tops.get(canvas, -1):
+            self._canvas_tops[canvas] = order
+            return None
+        keys = iter(self._rings)
+        for other in keys:
+            if other == key:
+                break
+        for other in keys:
+            if self._rings[other]._canvas_items.get(canvas):
+                return self._rings[other]
+        return None
+
+    def selected_rings(self):
+        '''Selected rings, in order of id (so in the order they were
+        added).'''
+        return [self._rings[key] for key in sorted(self.selected, key=int)]
+
+    def clear_selection(self):
+        for key in list(self.selected):
+            self._rings[key].selected = False
+
+    def is_locked(self, ring):
+        return str(ring.id) not in self.unlocked
+
+    def lock(self, ring):
+        self.unlocked.discard(str(ring.id))
+
+    def unlock(self, ring):
+        self.unlocked.add(str(ring.id))
+
+
+class CanvasRenderer:
+    '''Draws a struct's frames to a tkinter canvas (or anything with the
+    same create_polygon/coords/itemconfigure/delete methods).'''
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+
+    def render(self, pw_struct):
+        pw_struct.draw(self.canvas)
 
 
 class PanawaveStruct:
-    '''data structure for storing our StickerRing composition'''
+    '''data structure for storing our StickerRing composition.
+
+    The struct, its rings and its orbit clock need no canvas or event loop.
+    Animation frames are handed to renderers (see attach_renderer), and are
+    timed by a scheduler (see attach_scheduler) attached from outside;
+    attach_canvas does both for a tkinter canvas.'''
 
     def __init__(self, tkinstance=None, canvas=None, *args):
-        '''We need to pass a reference to the canvas to store
-        locally in order to use the tk .wait callbacks in animation'''
-        # this is now a dict instead of a list so we can easily access 
-        #rings by ID.
-        self.ring_array = {}
+        '''A canvas may be passed as a shorthand for attach_canvas.'''
+        # kind -> callbacks; see subscribe().
+        self._subscribers = {kind: [] for kind in RING_EVENTS}
+        # rings by ID, along with the lock and selection state of each;
+        # see RingRegistry.
+        self.ring_array = RingRegistry(notify=self._emit)
         for arg in args:
             self.add_ring(*args)
         if tkinstance is not None:
             self.tkinstance=tkinstance
-        if canvas is not None:
-            self.canvas = canvas
         # This dictionary stores any state variables which we want to persist
         # along with saved documents. Only the contents of this dictionary and
-        # the ring_array are currently written to file.
+        # the ring_array are currently written to file; see saved_state.
         self.persistent_state = {
             # master scaler for animations. can also be modified by
             # passing as argument to any of the animation methods.
             "master_orbit_speed": 1.5,
-            # rings which have had .count uncoupled from multiples 
-            # of len(.scaler_list)
-            "unlocked_rings": []
             }
         # This dictionary is intended for variables that can be discarded when
         # saved to file.
         self.ephemeral_state = {
             "animating": False,
-            "anim_method" : "linear"
+            "anim_method" : "linear",
+            "target_fps": 30,
+            # play orbits from a precomputed seamless loop; see pwloop
+            "loop": False,
             }
+        # Frame times of the orbit animation, kept across restarts so they
+        # can be inspected from the app.
+        self.frame_stats = pwanimation.FrameStats()
+        self._frame_scheduler = None
+        self._loop_cache = None
+        self.renderers = []
+        self._schedule = None
+        self._cancel = None
+        self.clock = perf_counter
+        self.orbit_clock = pwanimation.OrbitClock(ORBIT_TICK_RATE)
+        if canvas is not None:
+            self.attach_canvas(canvas)
+
+    def attach_renderer(self, renderer):
+        '''Have renderer.render(pw_struct) called for every animation
+        frame.'''
+        self.renderers.append(renderer)
+
+    def detach_renderer(self, renderer):
+        self.renderers.remove(renderer)
+
+    def attach_scheduler(self, schedule, cancel=None, clock=perf_counter):
+        '''Set the scheduler which times animation frames. schedule and
+        cancel follow tkinter's after()/after_cancel() signatures; clock is
+        the time source, in seconds, which the orbit follows. See
+        pwanimation.ManualScheduler for a headless one.'''
+        self._schedule = schedule
+        self._cancel = cancel
+        self.clock = clock
+        self.orbit_clock.clock = clock
+
+    def attach_canvas(self, canvas):
+        '''Draw frames to a tkinter canvas, scheduled by its event loop.
+        The canvas also becomes the default for draw() and
+        clear_canvas().'''
+        self.canvas = canvas
+        self.attach_renderer(CanvasRenderer(canvas))
+        self.attach_scheduler(canvas.after, canvas.after_cancel)
 
     def draw(self, target_canvas=None):
         '''plot all elements to a canvas'''
@@ -278,6 +723,38 @@ class PanawaveStruct:
         for ring in self.ring_array.values():
             ring.draw(target_canvas)
 
+    def clear_canvas(self, target_canvas=None):
+        '''remove all of our rings' items from a canvas, leaving any other
+        items on it alone.'''
+        if target_canvas is None:
+            target_canvas = self.canvas
+        for ring in self.ring_array.values():
+            ring.forget_canvas(target_canvas)
+        self.ring_array._canvas_tops.pop(target_canvas, None)
+
+    # Change notification:
+
+    def subscribe(self, kind, callback):
+        '''Call callback(change) with a RingChange whenever a change of the
+        given kind happens: RING_ADDED, RING_REMOVED, RING_GEOMETRY_CHANGED
+        (radius, count, offset or scaler_list) or RING_SELECTION_CHANGED.
+        Callbacks run synchronously, so views should just note what changed
+        and schedule their own update.'''
+        self._subscribers[kind].append(callback)
+
+    def unsubscribe(self, kind, callback):
+        try:
+            self._subscribers[kind].remove(callback)
+        except ValueError:
+            pass
+
+    def _emit(self, kind, ring):
+        callbacks = self._subscribers[kind]
+        if callbacks:
+            change = RingChange(kind, ring)
+            for callback in list(callbacks):
+                callback(change)
+
     # Working with child  objects:
 
     def add_ring(self, *args, **kwargs):
@@ -291,27 +768,38 @@ class PanawaveStruct:
                 # Some of the args may handle strings, lists etc.,
                 # so just let the StickerRing deal with them
                 evaluated_args.append(arg)
-        self.canvas.delete("all")
 
         # We need to initialize the new ring before adding it to the ring_array
         # so we can reference it's id as the key.
+        kwargs.setdefault("id", self.ring_array.new_id())
         new_ring = StickerRing(*evaluated_args, **kwargs)
-        self.ring_array[str(new_ring.id)] = new_ring
+        return self.ring_array.add(new_ring)
+
+    def remove_ring(self, ring):
+        '''remove a StickerRing (or the ring with the given id).'''
+        return self.ring_array.remove(ring)
+
+    def find_overlaps(self):
+        '''All pairs of overlapping stickers, as ((ring key, sticker index),
+        (ring key, sticker index)) tuples. See pwoverlap.'''
+        return pwoverlap.find_overlaps(self.ring_array)
+
+    def overlaps_with(self, ring):
+        '''The pairs of overlapping stickers involving one ring, with that
+        ring's sticker first.'''
+        return pwoverlap.overlaps_with(ring, self.ring_array)
 
     def clear_selection(self):
         '''un-select all rings. You need to handle redrawing after.'''
-        for ring in self.ring_array.values():
-            ring.selected = False
+        self.ring_array.clear_selection()
 
     def lock_ring_count_to_scaler(self, ring):
         '''Lock the given ring's count to multiples of the scaler_list. This is
         the default state for new rings.'''
-        unlock_l = self.persistent_state['unlocked_rings']
-            # True = lock
-        if str(ring.id) in unlock_l:
+        if not self.ring_array.is_locked(ring):
             log.debug("Removing ring {0} from the unlocked_rings list because "
                     "lock_ring_count_to_scaler was called.".format(ring.id))
-            unlock_l.remove(str(ring.id))
+            self.ring_array.lock(ring)
         else:
             log.debug("lock_ring_count_to_scaler was called on ring {0}, "
                     "but it is already locked.".format(ring.id))
@@ -320,12 +808,10 @@ class PanawaveStruct:
         '''Unlink the given ring's count from multiples of the scaler_list.
         This is not an attribute of the StickerRing itself, because it is
         considered an interface state.'''
-        unlock_l = self.persistent_state['unlocked_rings']
-            # True = lock
-        if str(ring.id) not in unlock_l:
+        if self.ring_array.is_locked(ring):
             log.debug("Adding ring {0} to the unlocked_ring list because "
                     "unlock_ring_count_from_scaler was called.".format(ring.id))
-            unlock_l.append(str(ring.id))
+            self.ring_array.unlock(ring)
         else:
             log.debug("unlock_ring_count_from_scaler was called on ring {0}, "
                     "but it is already unlocked.".format(ring.id))
@@ -333,25 +819,38 @@ class PanawaveStruct:
     def is_count_locked_for_ring(self, ring):
         '''Returns True if given ring's sticker count is locked to multiples of
         the scaler list.'''
-        unlock_l = self.persistent_state['unlocked_rings']
-        if str(ring.id) not in unlock_l:
-            return True
+        return self.ring_array.is_locked(ring)
+
+    def saved_state(self):
+        '''persistent_state as written to file, including the ids of the
+        rings whose count is unlocked.'''
+        state = dict(self.persistent_state)
+        state["unlocked_rings"] = sorted(self.ring_array.unlocked)
+        return state
 
     # File Input/Output Methods:
 
+    @pwprofile.timed("serialization")
     def write_out(self, output_file):
-        '''TODO write the current composition to file in a re-usable format'''
+        '''write the current composition to file in a re-usable format.
+        Files with a .pwv extension are written in the compact binary format
+        (see pwformat); any other name gets the JSON documents used by
+        earlier versions.'''
         try:
             os.rename(output_file, output_file + "~")
             backup_file = output_file + "~"
         except OSError:
             pass
-        with open(output_file, "w") as file:
-            json.dump(self.persistent_state, file, default=pw_json_serializer,
-                    sort_keys=True, indent=4)
-            file.write('\n')
-            json.dump({"ring_array": self.ring_array}, file,
-                    default=pw_json_serializer, sort_keys=True, indent=4)
+        if pwformat.is_binary_path(output_file):
+            with open(output_file, "wb") as file:
+                pwformat.write_pwv(self, file)
+        else:
+            with open(output_file, "w") as file:
+                json.dump(self.saved_state(), file,
+                        default=pw_json_serializer, sort_keys=True, indent=4)
+                file.write('\n')
+                json.dump({"ring_array": self.ring_array}, file,
+                        default=pw_json_serializer, sort_keys=True, indent=4)
             # other things we may want to include:
             # app state: selected struct, undo history?
             # selected anim method
@@ -369,24 +868,148 @@ class PanawaveStruct:
             except (OSError, NameError):
                 pass
 
-    def write_out_instructions(self, output_file):
-        '''TODO write to file in a format (tbd) which can be used as
-        cnc control for a plotting device'''
-        pass
+    def write_out_svg(self, output_file, **kwargs):
+        '''write the composition as it is currently displayed to an SVG
+        file. See pwvector.write_svg for options.'''
+        pwvector.write_svg(self, output_file, **kwargs)
+
+    def write_out_instructions(self, output_file, **kwargs):
+        '''write the composition as control instructions for a pen plotter:
+        HP-GL for .hpgl/.plt files, G-code for .gcode/.nc. Stickers are
+        ordered to minimize pen-up travel. Returns a report of the sticker
+        count and the estimated draw and travel distances; see
+        pwplotter.write_instructions for options.'''
+        return pwplotter.write_instructions(self, output_file, **kwargs)
 
+    @pwprofile.timed("serialization")
     def load_from_file(self, input_file):
-        '''TODO populate the struct from the given file'''
-        pass
+        '''populate the struct from the given file. Saved files are one or
+        more JSON documents written back to back; every variant written by
+        earlier versions is accepted:
+
+          - a bare list of rings (the oldest format),
+          - a state dict followed by a list of rings,
+          - a state dict (or its keys dumped as strings) followed by
+            {"ring_array": [rings]},
+          - a state dict followed by {"ring_array": {id: ring}} (current).
+
+        Documents are decoded one at a time, so a file truncated partway
+        through still yields everything before the damage. Rings are built
+        directly from their saved parameters; saved sticker points are
+        ignored and geometry is only computed when first drawn.
+
+        Binary .pwv files are recognised by their header rather than their
+        extension, since earlier versions saved JSON under that name too.'''
+        if pwformat.is_binary_file(input_file):
+            self._load_from_pwv(input_file)
+            return
+        with open(input_file) as file:
+            text = file.read()
+        ring_records = []
+        unlocked = []
+        for document in _read_json_documents(text, input_file):
+            if isinstance(document, list):
+                ring_records.extend(document)
+            elif isinstance(document, dict) and "ring_array" in document:
+                saved_rings = document["ring_array"]
+                if isinstance(saved_rings, dict):
+                    for key, record in saved_rings.items():
+                        record.setdefault("id", key)
+                    saved_rings = saved_rings.values()
+                ring_records.extend(saved_rings)
+            elif isinstance(document, dict):
+                self._load_persistent_state(document, unlocked)
+            else:
+                log.debug("Ignoring stray document in {0}: {1}".format(
+                    input_file, repr(document)))
+        base_sticker = self.persistent_state.get("base_sticker")
+        if base_sticker is not None:
+            base_sticker = base_sticker["points"]
+        ids = {}
+        for record in ring_records:
+            ring_kwargs = _ring_kwargs_from_record(record, base_sticker)
+            self._add_loaded_ring(ring_kwargs, ids)
+        self._unlock_loaded_rings(unlocked, ids)
+        log.info("Loaded {0} rings from {1}".format(len(ring_records),
+            input_file))
+
+    def _load_from_pwv(self, input_file):
+        '''populate the struct from a binary .pwv file. The file is read
+        eagerly and every record turned into a StickerRing up front: the
+        registry's radius index, selection and draw order, and the views,
+        which draw and list every ring as soon as a file is opened, all
+        need the ring objects. As with JSON files, ring geometry is only
+        computed once a ring is used.'''
+        with pwformat.PWVReader(input_file) as reader:
+            unlocked = []
+            self._load_persistent_state(reader.persistent_state(), unlocked)
+            ids = {}
+            for record in reader.ring_records():
+                self._add_loaded_ring(reader.ring_kwargs(record), ids)
+            self._unlock_loaded_rings(unlocked, ids)
+            log.info("Loaded {0} rings from {1}".format(len(reader),
+                input_file))
+
+    def _add_loaded_ring(self, ring_kwargs, ids):
+        '''Create a ring from loaded arguments and add it to the ring_array.
+        Geometry matching the default base sticker is dropped, so it isn't
+        stored on the ring and written back out. A ring whose saved id is
+        already in use gets a new one; ids maps each saved id to the id of
+        the first ring loaded with it.'''
+        if ring_kwargs.get("geometry") == StickerRing.baseStickerPoly:
+            del ring_kwargs["geometry"]
+        saved_id = ring_kwargs.get("id")
+        if saved_id is None or str(saved_id) in self.ring_array:
+            ring_kwargs["id"] = self.ring_array.new_id()
+            if saved_id is not None:
+                log.warning("Ring id {0} is already in use; loading the "
+                        "ring as {1}".format(saved_id, ring_kwargs["id"]))
+        ring = self.ring_array.add(StickerRing(**ring_kwargs))
+        if saved_id is not None:
+            ids.setdefault(str(saved_id), str(ring.id))
+        return ring
+
+    def _unlock_loaded_rings(self, unlocked, ids):
+        '''Unlock the loaded rings whose saved ids are listed in unlocked,
+        following ids (see _add_loaded_ring) to the ids they were loaded
+        as. Ids of rings which were not loaded are dropped.'''
+        self.ring_array.unlocked.update(ids[str(ring_id)]
+                for ring_id in unlocked if str(ring_id) in ids)
+
+    def _load_persistent_state(self, saved_state, unlocked):
+        '''Merge a saved state dict into persistent_state. Keys which are
+        now ephemeral (e.g. 'animating' in old files) are dropped, and the
+        saved unlocked ring ids are appended to unlocked, to be applied
+        once the rings are loaded.'''
+        for key, value in saved_state.items():
+            if key in self.ephemeral_state:
+                continue
+            if key == "unlocked_rings":
+                unlocked.extend(value)
+                continue
+            self.persistent_state[key] = value
 
     # High-level manipulation methods:
 
     def stop_animation(self):
+        '''Stop orbiting, leaving each ring at its displayed position.'''
         self.ephemeral_state['animating'] = False
+        if self._frame_scheduler is not None:
+            self._frame_scheduler.stop()
+            self._frame_scheduler = None
+        self.orbit_clock.stop()
+        self.orbit_clock.seek(0.0)
+        for ring in self.ring_array.values():
+            ring.commit_orbit_rotation()
 
-    def orbit(self, method="random", canvas=None, speed=None):
+    def orbit(self, method="random", canvas=None, speed=None, loop=None):
         ''' Several orbit methods are defined here. All will assign a
         speed value between 0 and 1 to each ring which is scaled
-        by the master speed in the animation method below.'''
+        by the master speed in the animation method below. A scheduler must
+        have been attached; canvas, if given, is attached first (see
+        attach_canvas). With loop (by default ephemeral_state['loop']), one
+        seamless loop of the orbit is precomputed and played back instead;
+        see cache_loop.'''
         if len(self.ring_array) is 0:
             # just return if the array is empty instead of catching all
             # the divide by zero errors below
@@ -406,35 +1029,94 @@ class PanawaveStruct:
             log.debug("Received an invalid orbit method: '" + method + "'. exiting.")
             return
         # Linear speed, units/sec.
-        if canvas is None:
-            canvas = self.canvas
+        if canvas is not None and canvas is not getattr(self, "canvas", None):
+            self.attach_canvas(canvas)
+        if self._schedule is None:
+            raise RuntimeError("No scheduler attached to animate with; see "
+                    "PanawaveStruct.attach_scheduler.")
         if speed is not None:
             self.persistent_state["master_orbit_speed"] = speed
-        self.ephemeral_state['animating'] = True
-        self._animation_index = 1
-        self._animate_orbit()
-
-    def _draw_one_frame(self, canvas, index):
-        working_canvas = canvas
-        working_canvas.delete("all")
-        for ringnum, ring in enumerate(self.ring_array.values()):
-            increment = self.persistent_state["master_orbit_speed"] \
-                    * ring.radial_speed
-            log.debug("Ring {0} position at start: {1}".format(ringnum, ring.offsetDegrees))
-            log.debug("Rotating ring {0} by increment {1}".format(ringnum, increment))
-            ring.rotate(increment)
-            log.debug("Ring {0} position after rotation: {1}".format(
-                ringnum, ring.offsetDegrees))
-        self.draw(working_canvas)
+        # Start the new orbit from wherever the rings are displayed now.
+        for ring in self.ring_array.values():
+            ring.commit_orbit_rotation()
+        if self._frame_scheduler is not None:
+            self._frame_scheduler.stop()
+        self.orbit_clock.seek(0.0)
+        if loop is None:
+            loop = self.ephemeral_state['loop']
+        if loop:
+            # built before the struct counts as animating, in case it fails
+            loop_cache = self.cache_loop()
+            self.ephemeral_state['animating'] = True
+            self._animate_loop(loop_cache)
+        else:
+            self.ephemeral_state['animating'] = True
+            self._animate_orbit()
 
-    def _animate_orbit(self):
-        '''this is a mess. we're functioning without any arguments because
-        tk's callback won't pass us any, so the canvas has to be passed
-        allllll the way down. but we're
-        accepting an arbitrary canvas in the related functions above, and
-        accepting a self reference when called from orbit_randomly.'''
-        if self.ephemeral_state['animating'] is True:
-            self._draw_one_frame(self.canvas, self._animation_index)
-            self._animation_index = self._animation_index + 1
-            self.canvas.after(100, self._animate_orbit)
+    def seek_orbit(self, t):
+        '''Position every ring at orbit time t (in orbit ticks since the
+        orbit started; see ORBIT_TICK_RATE). Each ring is displayed at
+        offsetDegrees + radial_speed * master_orbit_speed * t, computed from
+        its untouched geometry, so any t can be shown directly and frames do
+        not accumulate error.'''
+        master_speed = self.persistent_state["master_orbit_speed"]
+        for ring in self.ring_array.values():
+            ring.set_orbit_rotation(
+                    getattr(ring, "radial_speed", 0) * master_speed * t)
+
+    @pwprofile.timed("draw")
+    def render_frame(self):
+        '''Position the rings at the orbit clock's current time and hand the
+        frame to every attached renderer.'''
+        ticks = self.orbit_clock.ticks()
+        self.seek_orbit(ticks)
+        pwlogging.trace("Positioned rings for orbit tick", tick=ticks)
+        for renderer in self.renderers:
+            renderer.render(self)
+
+    def cache_loop(self, **kwargs):
+        '''Precompute one seamless loop of the orbit at the rings' current
+        speeds, reusing the last one if nothing has changed since. See
+        pwloop.LoopCache for options.'''
+        if self._loop_cache is not None:
+            if not kwargs and self._loop_cache.matches(self):
+                return self._loop_cache
+            self._loop_cache.close()
+        kwargs.setdefault("fps", self.ephemeral_state['target_fps'])
+        self._loop_cache = pwloop.LoopCache(self, ORBIT_TICK_RATE, **kwargs)
+        return self._loop_cache
 
+    @pwprofile.timed("draw")
+    def render_loop_frame(self, loop_cache, frame):
+        '''Position the rings at a frame of a cached loop and hand it to
+        every attached renderer.'''
+        loop_cache.apply(self, frame)
+        for renderer in self.renderers:
+            renderer.render(self)
+
+    def _animate_loop(self, loop_cache):
+        '''Play a cached loop from the attached scheduler, repeating it
+        until stopped.'''
+        self._frame_scheduler = pwanimation.FrameScheduler(
+                lambda elapsed: self.render_loop_frame(loop_cache,
+                    int(elapsed * loop_cache.fps)),
+                self._schedule,
+                self._cancel,
+                target_fps=loop_cache.fps,
+                stats=self.frame_stats,
+                clock=self.clock)
+        self._frame_scheduler.start()
+
+    def _animate_orbit(self):
+        '''Start the orbit clock, and a FrameScheduler which renders frames
+        from the attached scheduler at ephemeral_state['target_fps']. Frame
+        times are collected in self.frame_stats.'''
+        self.orbit_clock.start()
+        self._frame_scheduler = pwanimation.FrameScheduler(
+                lambda elapsed: self.render_frame(),
+                self._schedule,
+                self._cancel,
+                target_fps=self.ephemeral_state['target_fps'],
+                stats=self.frame_stats,
+                clock=self.clock)
+        self._frame_scheduler.start()
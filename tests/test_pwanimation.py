@@ -0,0 +1,36 @@
+import pytest
+
+import pwanimation
+from benchmarks.synthetic import make_struct
+from radialstructs import ORBIT_TICK_RATE
+
+
+class _Renderer:
+    def __init__(self):
+        self.frames = 0
+
+    def render(self, pw_struct):
+        self.frames += 1
+
+
+def test_headless_orbit_follows_the_clock():
+    scheduler = pwanimation.ManualScheduler()
+    pw_struct = make_struct(rings=4, stickers=8)
+    pw_struct.attach_scheduler(scheduler.schedule, scheduler.cancel,
+            clock=scheduler.clock)
+    renderer = _Renderer()
+    pw_struct.attach_renderer(renderer)
+    pw_struct.orbit(method="linear", speed=2.0, loop=False)
+    scheduler.advance(1.0)
+    assert renderer.frames > 0
+    # the last frame drawn may be a little behind the clock; draw one now
+    pw_struct.render_frame()
+    ticks = pw_struct.orbit_clock.ticks()
+    assert ticks == pytest.approx(ORBIT_TICK_RATE * 1.0)
+    for ring in pw_struct.ring_array.values():
+        assert ring.displayed_offset() == pytest.approx(
+                (ring.offsetDegrees + ring.radial_speed * 2.0 * ticks) % 360)
+    pw_struct.stop_animation()
+    frames = renderer.frames
+    scheduler.advance(1.0)
+    assert renderer.frames == frames
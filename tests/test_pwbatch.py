@@ -0,0 +1,27 @@
+import io
+import os
+
+import pwbatch
+
+
+def test_glob_matching_nothing_fails(tmp_path):
+    stream = io.StringIO()
+    pattern = str(tmp_path / "*.pwv")
+    assert pwbatch.render_batch([pattern], jobs=1, stream=stream) == 1
+
+
+def test_colliding_outputs_are_not_rendered(tmp_path):
+    inputs = []
+    for directory in ("a", "b"):
+        os.mkdir(str(tmp_path / directory))
+        path = tmp_path / directory / "same.pwv"
+        path.write_text("[]")
+        inputs.append(str(path))
+    output_dir = tmp_path / "out"
+    stream = io.StringIO()
+    assert pwbatch.render_batch(inputs, format="svg",
+            output_dir=str(output_dir), jobs=1, stream=stream) == 2
+    assert not output_dir.exists()
+    # beside their inputs the outputs do not collide
+    assert pwbatch.render_batch(inputs, format="svg", jobs=1,
+            stream=stream) == 0
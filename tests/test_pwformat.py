@@ -0,0 +1,68 @@
+import pytest
+
+import pwformat
+from benchmarks.synthetic import make_struct, regular_polygon
+from radialstructs import PanawaveStruct
+
+
+def _saved(rings):
+    return [(ring.id, ring.radius, ring.count, ring.offsetDegrees,
+            list(ring.scaler_list), ring.baseStickerPoly)
+            for ring in rings.values()]
+
+
+def test_round_trip(tmp_path):
+    pw_struct = make_struct(rings=8, stickers=12, scaler_length=3)
+    pw_struct.add_ring(400, 5, 0, [1], geometry=regular_polygon(6))
+    first = pw_struct.ring_array.by_radius()[0]
+    pw_struct.ring_array.unlocked.add(str(first.id))
+    path = str(tmp_path / "composition.pwv")
+    pw_struct.write_out(path)
+    assert pwformat.is_binary_file(path)
+
+    loaded = PanawaveStruct()
+    loaded.load_from_file(path)
+    assert _saved(loaded.ring_array) == _saved(pw_struct.ring_array)
+    assert loaded.ring_array.unlocked == pw_struct.ring_array.unlocked
+
+
+def test_reader_random_access(tmp_path):
+    pw_struct = make_struct(rings=5, stickers=7)
+    path = str(tmp_path / "composition.pwv")
+    pw_struct.write_out(path)
+    with pwformat.PWVReader(path) as reader:
+        assert len(reader) == 5
+        records = list(reader.ring_records())
+        assert reader.ring_record(3) == records[3]
+        with pytest.raises(IndexError):
+            reader.ring_record(5)
+
+
+def test_geometry_is_not_shared(tmp_path):
+    pw_struct = make_struct(rings=2, stickers=4, vertices=5)
+    path = str(tmp_path / "composition.pwv")
+    pw_struct.write_out(path)
+    with pwformat.PWVReader(path) as reader:
+        geometry = reader.geometry(0)
+        geometry[0][0] = 1000.0
+        assert reader.geometry(0)[0][0] != 1000.0
+
+
+@pytest.mark.parametrize("length", [0, 3, pwformat.HEADER.size - 1,
+        pwformat.HEADER.size + 10, -1])
+def test_truncated_file(tmp_path, length):
+    path = str(tmp_path / "composition.pwv")
+    make_struct(rings=3, stickers=4).write_out(path)
+    with open(path, "rb") as file:
+        data = file.read()
+    with open(path, "wb") as file:
+        file.write(data[:length])
+    with pytest.raises(ValueError):
+        pwformat.PWVReader(path)
+
+
+def test_not_a_pwv_file(tmp_path):
+    path = tmp_path / "composition.pwv"
+    path.write_bytes(b"\0" * 200)
+    with pytest.raises(ValueError):
+        pwformat.PWVReader(str(path))
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+import pwhittest
+from benchmarks.synthetic import make_struct
+
+
+@pytest.fixture
+def pw_struct():
+    pw_struct = make_struct(rings=10, stickers=30, scaler_length=3,
+            vertices=5)
+    for index, ring in enumerate(pw_struct.ring_array.values()):
+        if index % 3 == 0:
+            ring.set_orbit_rotation(17.5 * index)
+    return pw_struct
+
+
+def _brute_force_hits(ring_array, x, y):
+    return {(ring.id, k) for ring in ring_array.values()
+            for k, polygon in enumerate(ring.displayed_vertices())
+            if pwhittest.point_in_polygon(x, y,
+                [tuple(point) for point in polygon])}
+
+
+def test_hits_match_brute_force(pw_struct):
+    ring_array = pw_struct.ring_array
+    rng = random.Random(1)
+    found = 0
+    for i in range(500):
+        x, y = rng.uniform(-320, 320), rng.uniform(-320, 320)
+        expected = _brute_force_hits(ring_array, x, y)
+        assert {(ring.id, k) for ring, k
+                in pwhittest.hits(ring_array, x, y)} == expected
+        found += bool(expected)
+    assert found
+
+
+def test_hit_test_returns_topmost_ring(pw_struct):
+    ring_array = pw_struct.ring_array
+    draw_order = list(ring_array.values())
+    rng = random.Random(2)
+    for i in range(500):
+        x, y = rng.uniform(-320, 320), rng.uniform(-320, 320)
+        hit_ids = {ring_id for ring_id, k
+                in _brute_force_hits(ring_array, x, y)}
+        expected = None
+        for ring in draw_order:
+            if ring.id in hit_ids:
+                expected = ring
+        assert pwhittest.hit_test(ring_array, x, y) is expected
+
+
+def test_rings_in_rect_match_brute_force():
+    pw_struct = make_struct(rings=10, stickers=30, scaler_length=3)
+    ring_array = pw_struct.ring_array
+    rng = random.Random(3)
+    for i in range(200):
+        x0, x1 = sorted(rng.uniform(-320, 320) for j in range(2))
+        y0, y1 = sorted(rng.uniform(-320, 320) for j in range(2))
+        expected = {ring.id for ring in ring_array.values()
+                if any(x0 <= x <= x1 and y0 <= y <= y1
+                    for x, y in ring.centroids)}
+        assert {ring.id for ring in pwhittest.rings_in_rect(ring_array,
+                x1, y1, x0, y0)} == expected
@@ -0,0 +1,65 @@
+from fractions import Fraction
+
+import pwloop
+from benchmarks.synthetic import make_struct
+
+
+def test_exact_period_is_lcm_of_ring_periods():
+    # periods of 360/2 = 180 and 360/3 = 120 ticks
+    rates = [("1", 2.0, 360.0), ("2", 3.0, 360.0), ("3", 0, 360.0)]
+    assert pwloop.exact_period(rates) == Fraction(360)
+
+
+def test_find_loop_uses_exact_period():
+    rates = [("1", 2.0, 360.0), ("2", 3.0, 360.0)]
+    frames, period, error = pwloop.find_loop(rates, 4.0, 1000)
+    assert (frames, period, error) == (90, 360.0, 0.0)
+
+
+def test_find_loop_with_no_moving_rings():
+    assert pwloop.find_loop([("1", 0, 360.0)], 2.0, 100) == (1, 2.0, 0.0)
+
+
+def test_find_loop_slow_ring_longer_than_max_frames():
+    # one turn of the slow ring takes 36000 ticks, far more than 100
+    # frames of 2 ticks, so no loop fits; the longest one is used
+    rates = [("1", 0.01, 360.0), ("2", 1.7, 360.0)]
+    frames, period, error = pwloop.find_loop(rates, 2.0, 100)
+    assert frames == 100
+    assert period == 200.0
+    assert error > 0.01
+
+
+def test_loop_cache_is_seamless():
+    pw_struct = make_struct(rings=6, stickers=12)
+    for index, ring in enumerate(pw_struct.ring_array.values()):
+        ring.radial_speed = index / 6
+    cache = pwloop.LoopCache(pw_struct, 100, fps=10, max_seconds=60)
+    assert cache.error == 0.0
+    assert cache.matches(pw_struct)
+    # the frame after the last is the first again
+    assert cache.rotations(cache.frames) == cache.rotations(0)
+    cache.close()
+
+
+def test_orbit_with_slow_ring_loops():
+    pw_struct = make_struct(rings=150, stickers=10)
+    pw_struct.attach_scheduler(lambda delay_ms, callback: None)
+    pw_struct.orbit(method="linear", loop=True)
+    assert pw_struct.ephemeral_state["animating"]
+    assert pw_struct._loop_cache.frames >= 1
+    pw_struct.stop_animation()
+
+
+def test_orbit_not_animating_if_loop_cache_fails(monkeypatch):
+    pw_struct = make_struct(rings=3, stickers=6)
+    pw_struct.attach_scheduler(lambda delay_ms, callback: None)
+
+    def fail(**kwargs):
+        raise MemoryError
+    monkeypatch.setattr(pw_struct, "cache_loop", fail)
+    try:
+        pw_struct.orbit(method="linear", loop=True)
+    except MemoryError:
+        pass
+    assert not pw_struct.ephemeral_state["animating"]
@@ -0,0 +1,65 @@
+import pytest
+
+import pwgeometry
+import pwoverlap
+from benchmarks.synthetic import make_struct
+
+
+def _polygon(vertices):
+    return [tuple(point) for point in vertices]
+
+
+def _brute_force_overlaps(ring_array):
+    stickers = [(str(ring.id), k, _polygon(polygon))
+            for ring in ring_array.values()
+            for k, polygon in enumerate(ring.vertices)]
+    found = set()
+    for i, (key_a, k_a, p) in enumerate(stickers):
+        for key_b, k_b, q in stickers[i + 1:]:
+            if pwoverlap.polygons_overlap(p, q):
+                found.add(frozenset(((key_a, k_a), (key_b, k_b))))
+    return found
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "python"])
+def use_numpy(request, monkeypatch):
+    if request.param and pwgeometry.numpy is None:
+        pytest.skip("numpy is not installed")
+    monkeypatch.setattr(pwgeometry, "use_numpy", request.param)
+    return request.param
+
+
+def test_polygons_overlap():
+    square = [(0, 0), (2, 0), (2, 2), (0, 2)]
+    assert pwoverlap.polygons_overlap(square,
+            [(1, 1), (3, 1), (3, 3), (1, 3)])
+    assert not pwoverlap.polygons_overlap(square,
+            [(3, 0), (5, 0), (5, 2), (3, 2)])
+    # touching along an edge does not count
+    assert not pwoverlap.polygons_overlap(square,
+            [(2, 0), (4, 0), (4, 2), (2, 2)])
+
+
+def test_find_overlaps_matches_brute_force(use_numpy):
+    pw_struct = make_struct(rings=8, stickers=24, scaler_length=2,
+            vertices=5)
+    ring_array = pw_struct.ring_array
+    found = {frozenset(pair)
+            for pair in pwoverlap.find_overlaps(ring_array)}
+    expected = _brute_force_overlaps(ring_array)
+    assert expected
+    assert found == expected
+
+
+def test_overlaps_with_matches_find_overlaps(use_numpy):
+    pw_struct = make_struct(rings=8, stickers=24, scaler_length=2)
+    ring_array = pw_struct.ring_array
+    everything = {frozenset(pair)
+            for pair in pwoverlap.find_overlaps(ring_array)}
+    for ring in ring_array.values():
+        key = str(ring.id)
+        pairs = pwoverlap.overlaps_with(ring, ring_array)
+        assert all(pair[0][0] == key for pair in pairs)
+        assert {frozenset(pair) for pair in pairs} == \
+                {pair for pair in everything
+                    if key in (sticker[0] for sticker in pair)}
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from radialstructs import PanawaveStruct, StickerRing
+
+
+def _ring(ring_id, radius):
+    return {"id": ring_id, "radius": radius, "count": 4,
+            "offsetDegrees": 0, "scaler_list": [1]}
+
+
+def test_registry_rejects_id_in_use():
+    pw_struct = PanawaveStruct()
+    ring = pw_struct.add_ring(50, 4, 0, [1])
+    with pytest.raises(ValueError):
+        pw_struct.ring_array.add(StickerRing(60, 4, id=ring.id))
+    assert len(pw_struct.ring_array) == 1
+
+
+def test_duplicate_ids_in_file_keep_unlocked_on_saved_ring(tmp_path):
+    path = tmp_path / "duplicates.json"
+    path.write_text(json.dumps({"unlocked_rings": [7]}) +
+            json.dumps([_ring(7, 50), _ring(7, 80)]))
+    pw_struct = PanawaveStruct()
+    pw_struct.load_from_file(str(path))
+    rings = pw_struct.ring_array
+    assert sorted(ring.radius for ring in rings.values()) == [50, 80]
+    assert [rings[key].radius for key in rings.unlocked] == [50]
+
+
+def test_loading_into_struct_remaps_unlocked_ids(tmp_path):
+    pw_struct = PanawaveStruct()
+    existing = pw_struct.add_ring(50, 4, 0, [1])
+    path = tmp_path / "composition.json"
+    path.write_text(json.dumps({"unlocked_rings": [existing.id, 90]}) +
+            json.dumps([_ring(existing.id, 120)]))
+    pw_struct.load_from_file(str(path))
+    rings = pw_struct.ring_array
+    assert rings.is_locked(existing)
+    # the loaded ring is unlocked under its new id; 90 matched no ring
+    assert [rings[key].radius for key in rings.unlocked] == [120]